@@ -0,0 +1,102 @@
+# Throughput of feeding a download into a pipe, as the ffmpeg feeders do.
+# Serves SIZE bytes over loopback HTTP and drains the pipe to /dev/null,
+# comparing iter_content with a file object to YoutubeVideoDownloader.feed_pipe
+# (readinto into one buffer and os.write). Prints wall throughput and the
+# CPU seconds per GiB, the best of ROUNDS runs. The server runs in the same
+# process, so its share is included and equal across the variants.
+#
+#   python benchmarks/bench_feed_pipe.py [size_mib]
+import http.server
+import os
+import socketserver
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from vcd.platforms.youtube.download import YoutubeVideoDownloader
+from vcd.utils.http import HttpClient
+from vcd.utils.pipe import copy_fd, set_pipe_size
+
+BLOCK = b"x" * (1 << 20)
+ROUNDS = 3
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    blocks = 1024
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(self.blocks * len(BLOCK)))
+        self.end_headers()
+        for _ in range(self.blocks):
+            self.wfile.write(BLOCK)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def drain(read_fd, large_pipe):
+    if large_pipe:
+        set_pipe_size(read_fd)
+    null_fd = os.open(os.devnull, os.O_WRONLY)
+    copy_fd(read_fd, null_fd)
+    os.close(null_fd)
+    os.close(read_fd)
+
+
+def iter_content_feed(http_client, url, write_fd, size):
+    with http_client.get(url, stream=True) as res:
+        with os.fdopen(write_fd, "wb") as pipe:
+            for chunk in res.iter_content(chunk_size=65536):
+                pipe.write(chunk)
+
+
+def readinto_feed(chunk_size):
+    def feed(http_client, url, write_fd, size):
+        set_pipe_size(write_fd)
+        YoutubeVideoDownloader(None, http_client).feed_pipe(
+            {"decrypted_url": url, "itag": 0, "content_length": str(size)},
+            write_fd,
+            chunk_size=chunk_size,
+        )
+
+    return feed
+
+
+def main():
+    size_mib = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    _Handler.blocks = size_mib
+    server = _Server(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    http_client = HttpClient(None, None)
+    for name, feed, large_pipe in [
+        ("iter_content + fdopen, 64 KiB", iter_content_feed, False),
+        ("readinto + os.write, 64 KiB", readinto_feed(65536), True),
+        ("readinto + os.write, 1 MiB", readinto_feed(1 << 20), True),
+    ]:
+        best = None
+        for _ in range(ROUNDS):
+            read_fd, write_fd = os.pipe()
+            drainer = threading.Thread(target=drain, args=(read_fd, large_pipe))
+            drainer.start()
+            wall, cpu = time.perf_counter(), time.process_time()
+            feed(http_client, url, write_fd, size_mib << 20)
+            drainer.join()
+            result = (time.perf_counter() - wall, time.process_time() - cpu)
+            best = result if best is None or result[1] < best[1] else best
+        print(
+            f"{name}: {size_mib / best[0]:.0f} MiB/s, {best[1] * 1024 / size_mib:.2f} s cpu per GiB"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
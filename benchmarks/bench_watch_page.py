@@ -0,0 +1,101 @@
+# Time to pull the player response, ytcfg, player js url and title out of a
+# watch page: the per-field regexes YoutubeVideoInfo used before, against the
+# single scan of extract_watch_page. Runs on the trimmed pages in
+# tests/watch_pages and on a full sized page built from the first of them,
+# grown to about 1.6 MB, near what youtube.com serves. Prints the best of
+# ROUNDS runs of LOOPS extractions each.
+#
+#   python benchmarks/bench_watch_page.py [watch_page.html ...]
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from vcd.platforms.youtube.watch_page import extract_watch_page
+
+WATCH_PAGES = os.path.join(os.path.dirname(__file__), "..", "tests", "watch_pages")
+ROUNDS = 5
+LOOPS = 20
+
+_PLAYER_RESPONSE_RE = re.compile(
+    r"ytInitialPlayerResponse\s*=\s*({.+?})\s*;(?:var\s+meta|</script|\n)"
+)
+_PLAYER_JS_RE = re.compile(r"\"(?:PLAYER_JS_URL|jsUrl)\"\s*:\s*\"([^\"]+)\"")
+_YTCFG_RE = re.compile(r"ytcfg\.set\s*\(\s*({.+?})\s*\)\s*;")
+_TITLE_RE = re.compile(
+    r"(?isx)<meta(?=[^>]+(?:itemprop|name|property|id|http-equiv)=([\"\']?)(?:og:title|twitter:title|title)\1)[^>]+?content=([\"\'])(?P<content>.*?)\2"
+)
+
+
+def old_extract_watch_page(src):
+    player_response = _PLAYER_RESPONSE_RE.search(src)
+    player_js = _PLAYER_JS_RE.search(src)
+    yt_cfg = _YTCFG_RE.search(src)
+    title = _TITLE_RE.search(src)
+    return {
+        "player_response": json.loads(player_response.group(1)) if player_response else None,
+        "yt_cfg": json.loads(yt_cfg.group(1)) if yt_cfg else None,
+        "player_js_url": player_js.group(1) if player_js else None,
+        "title": title.group("content") if title else None,
+    }
+
+
+def full_sized(src):
+    # A served player response runs to a few hundred kB, mostly formats and
+    # caption tracks, and ytInitialData with the inline scripts after it make
+    # up the rest of the page.
+    player_response = extract_watch_page(src)["player_response"]
+    streaming_data = player_response["streamingData"]
+    streaming_data["adaptiveFormats"] = streaming_data["adaptiveFormats"] * 200
+    captions = player_response["captions"]["playerCaptionsTracklistRenderer"]
+    captions["captionTracks"] = captions["captionTracks"] * 200
+    start = src.index("var ytInitialPlayerResponse = ") + len("var ytInitialPlayerResponse = ")
+    _, end = json.JSONDecoder().raw_decode(src, start)
+    src = src[:start] + json.dumps(player_response, separators=(",", ":")) + src[end:]
+    items = [
+        {"compactVideoRenderer": {"videoId": f"v{i:010d}", "title": {"simpleText": f"Related {i}"}}}
+        for i in range(12000)
+    ]
+    data = json.dumps({"contents": {"secondaryResults": {"results": items}}})
+    script = "<script>(function(){var a=[];for(var i=0;i<10;i++){a.push(i)}})();</script>\n"
+    return src.replace(
+        "</body>", f"<script>var ytInitialData = {data};</script>{script * 2000}</body>"
+    )
+
+
+def best_time(extract, src):
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(LOOPS):
+            extract(src)
+        elapsed = (time.perf_counter() - start) / LOOPS
+        best = elapsed if best is None or elapsed < best else best
+    return best
+
+
+def main():
+    paths = sys.argv[1:] or [
+        os.path.join(WATCH_PAGES, name) for name in sorted(os.listdir(WATCH_PAGES))
+    ]
+    pages = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            pages.append((os.path.basename(path), f.read()))
+    pages.append((f"{pages[0][0]}, full sized", full_sized(pages[0][1])))
+    for name, src in pages:
+        if extract_watch_page(src) != old_extract_watch_page(src):
+            print(f"{name}: results differ")
+        old = best_time(old_extract_watch_page, src)
+        new = best_time(extract_watch_page, src)
+        print(
+            f"{name} ({len(src) / 1e6:.2f} MB): regexes {old * 1e3:.2f} ms, "
+            f"single scan {new * 1e3:.2f} ms, {old / new:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# Stand-in for ffmpeg. Writes FAKE_OUTPUT_BYTES to stdout in 64 KiB chunks
+# with a -progress block after each, or the inputs given with -i pipe:N when
+# there are any and FAKE_IGNORE_INPUTS is not set. FAKE_STALL_AFTER bytes of
+# output make it hang, FAKE_RC is the exit code.
+import os
+import sys
+import time
+
+args = sys.argv[1:]
+progress = os.fdopen(int(args[args.index("-progress") + 1].split(":")[1]), "w")
+inputs = [
+    int(args[i + 1].split(":")[1])
+    for i, arg in enumerate(args)
+    if arg == "-i" and args[i + 1].startswith("pipe:")
+]
+stall_after = int(os.environ.get("FAKE_STALL_AFTER", "-1"))
+
+
+def chunks():
+    if inputs and not os.environ.get("FAKE_IGNORE_INPUTS"):
+        for fd in inputs:
+            yield from iter(lambda: os.read(fd, 65536), b"")
+        return
+    remaining = int(os.environ.get("FAKE_OUTPUT_BYTES", "0"))
+    while remaining > 0:
+        size = min(65536, remaining)
+        remaining -= size
+        yield b"x" * size
+
+
+total = 0
+for chunk in chunks():
+    sys.stdout.buffer.write(chunk)
+    sys.stdout.buffer.flush()
+    total += len(chunk)
+    progress.write(
+        f"bitrate=1234.5kbits/s\ntotal_size={total}\nout_time_us={total * 10}\nspeed=1.5x\nprogress=continue\n"
+    )
+    progress.flush()
+    if 0 <= stall_after <= total:
+        time.sleep(1000)
+progress.write(f"total_size={total}\nout_time_us={total * 10}\nprogress=end\n")
+progress.flush()
+sys.exit(int(os.environ.get("FAKE_RC", "0")))
@@ -0,0 +1,89 @@
+# Local stand-in for a googlevideo videoplayback endpoint. It serves DATA with
+# Range support, and faults can be queued per request:
+#   ("drop", n)   send n bytes of the response body, then reset the connection
+#   ("stall", n)  send n bytes of the response body, then stop sending until
+#                 the server is stopped
+#   ("short", n)  send n bytes and close the connection, with the full
+#                 Content-Length announced
+import http.server
+import re
+import socket
+import socketserver
+import sys
+import threading
+
+DATA = bytes(range(256)) * 4096
+
+_RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)")
+
+
+class MediaServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, data=DATA) -> None:
+        super().__init__(("127.0.0.1", 0), _MediaHandler)
+        self.data = data
+        self.faults = []
+        self.ranges = []
+        self.stopped = threading.Event()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/videoplayback?itag=137"
+
+    def start(self) -> "MediaServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up early, which the faults cause on purpose.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def stop(self):
+        self.stopped.set()
+        self.shutdown()
+        self.server_close()
+
+
+class _MediaHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server: MediaServer = self.server
+        data = server.data
+        range_header = self.headers.get("Range")
+        server.ranges.append(range_header)
+        start, end = 0, len(data) - 1
+        match = _RANGE_RE.match(range_header or "")
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else end
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        else:
+            self.send_response(200)
+        body = data[start : end + 1]
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        kind, size = server.faults.pop(0) if server.faults else (None, None)
+        if kind is None:
+            self.wfile.write(body)
+            return
+        self.wfile.write(body[:size])
+        self.wfile.flush()
+        if kind == "stall":
+            server.stopped.wait()
+        self.close_connection = True
+        if kind == "drop":
+            # Time for the client to read what was sent, a reset discards
+            # unread data.
+            server.stopped.wait(0.2)
+            self.connection.setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, b"\x01\x00\x00\x00\x00\x00\x00\x00"
+            )
+        self.connection.close()
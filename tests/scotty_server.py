@@ -0,0 +1,132 @@
+# Local stand-in for the Scotty resumable upload endpoint of upload.youtube.com.
+# It speaks the start, upload, upload finalize and query commands, and faults
+# can be queued to exercise resuming:
+#   "drop"        read half of the chunk, commit it rounded down to the
+#                 granularity, then reset the connection
+#   "error"       answer 500 without committing anything
+#   "lose_final"  commit the chunk, then reset the connection before answering
+import http.server
+import json
+import socket
+import socketserver
+import threading
+
+GRANULARITY = 256 * 1024
+RESOURCE_ID = "stand-in-scotty-resource-id"
+
+
+class ScottyServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, granularity=GRANULARITY) -> None:
+        super().__init__(("127.0.0.1", 0), _ScottyHandler)
+        self.granularity = granularity
+        self.data = bytearray()
+        self.status = "active"
+        self.faults = []
+        self.commands = []
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def start_url(self):
+        return f"{self.base_url}/upload/studio"
+
+    def start(self) -> "ScottyServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _ScottyHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _read_body(self, size=None):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = bytearray()
+            while True:
+                chunk_size = int(self.rfile.readline().strip(), 16)
+                if chunk_size == 0:
+                    self.rfile.readline()
+                    return bytes(body)
+                body += self.rfile.read(chunk_size)
+                self.rfile.readline()
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length if size is None else min(size, length))
+
+    def _send(self, status, headers=None, body=b""):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reset(self):
+        self.close_connection = True
+        self.connection.shutdown(socket.SHUT_RDWR)
+
+    def _final_body(self):
+        return json.dumps({"scottyResourceId": RESOURCE_ID}).encode()
+
+    def do_POST(self):
+        server: ScottyServer = self.server
+        command = self.headers.get("x-goog-upload-command", "")
+        offset = self.headers.get("x-goog-upload-offset")
+        server.commands.append((command, offset and int(offset)))
+        if self.path.startswith("/upload/studio"):
+            self._read_body()
+            return self._send(
+                200,
+                {
+                    "X-Goog-Upload-URL": f"{server.base_url}/upload/session",
+                    "X-Goog-Upload-Chunk-Granularity": str(server.granularity),
+                    "X-Goog-Upload-Status": "active",
+                },
+            )
+        if command == "query":
+            self._read_body()
+            with server._lock:
+                return self._send(
+                    200,
+                    {
+                        "X-Goog-Upload-Status": server.status,
+                        "X-Goog-Upload-Size-Received": str(len(server.data)),
+                    },
+                    self._final_body() if server.status == "final" else b"",
+                )
+        fault = server.faults.pop(0) if server.faults else None
+        if fault == "drop":
+            length = int(self.headers.get("Content-Length", 0))
+            part = self._read_body(length // 2)
+            committed = len(part) - len(part) % server.granularity
+            with server._lock:
+                if int(offset) == len(server.data):
+                    server.data += part[:committed]
+            return self._reset()
+        body = self._read_body()
+        if fault == "error":
+            return self._send(500)
+        with server._lock:
+            if server.status != "active" or int(offset) != len(server.data):
+                return self._send(400, {"X-Goog-Upload-Status": server.status})
+            finalize = "finalize" in command
+            if not finalize and len(body) % server.granularity:
+                return self._send(400, {"X-Goog-Upload-Status": server.status})
+            server.data += body
+            if finalize:
+                server.status = "final"
+        if fault == "lose_final":
+            return self._reset()
+        if finalize:
+            return self._send(200, {"X-Goog-Upload-Status": "final"}, self._final_body())
+        self._send(200, {"X-Goog-Upload-Status": "active"})
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+from vcd.utils.cache import Cacheable
+
+THREADS = 64
+ROUNDS = 20
+
+
+class Counted(Cacheable):
+    def __init__(self, read_only_cache=False) -> None:
+        super().__init__(read_only_cache=read_only_cache)
+        self.calls = {}
+        self._calls_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._calls_lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    @property
+    @Cacheable.cache
+    def slow(self):
+        self._count("slow")
+        time.sleep(0.05)
+        return {"value": 1}
+
+    @property
+    @Cacheable.cache
+    def missing(self):
+        self._count("missing")
+        time.sleep(0.01)
+        return None
+
+    @property
+    @Cacheable.cache
+    def combined(self):
+        # Depends on a cached value and on one that is rolled back.
+        self._count("combined")
+        return {"slow": self.slow, "missing": self.missing}
+
+    @Cacheable.cache
+    def failing(self, i):
+        self._count("failing")
+        time.sleep(0.05)
+        raise ValueError(i)
+
+
+def run_threads(target):
+    barrier = threading.Barrier(THREADS)
+    results = []
+    errors = []
+
+    def run():
+        barrier.wait()
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+@pytest.mark.parametrize("read_only_cache", [False, True])
+def test_single_flight(read_only_cache):
+    for _ in range(ROUNDS):
+        cacheable = Counted(read_only_cache)
+        results, errors = run_threads(lambda: cacheable.combined)
+        assert not errors
+        assert len(results) == THREADS
+        assert all(x == {"slow": {"value": 1}, "missing": None} for x in results)
+        assert cacheable.calls["combined"] == 1
+        assert cacheable.calls["slow"] == 1
+        # The None result is rolled back by itself, without the values that
+        # were computed alongside it.
+        assert "combined" in cacheable._cache
+        assert "slow" in cacheable._cache
+        assert "missing" not in cacheable._cache
+
+
+def test_waiters_get_copies():
+    cacheable = Counted()
+    results, _ = run_threads(lambda: cacheable.slow)
+    cached = cacheable._cache["slow"][0]
+    # Only the computing thread gets the stored value, as on any miss.
+    copies = [x for x in results if x is not cached]
+    assert len(copies) == THREADS - 1
+    copies[0]["value"] = 2
+    assert cacheable.slow == {"value": 1}
+
+
+def test_exception_is_shared_by_waiters():
+    for _ in range(ROUNDS):
+        cacheable = Counted()
+        results, errors = run_threads(lambda: cacheable.failing(1))
+        assert not results
+        assert len(errors) == THREADS
+        assert all(isinstance(x, ValueError) for x in errors)
+        assert cacheable.calls["failing"] == 1
+        assert not any("failing" in str(key) for key in cacheable._cache)
+        # A later call computes again.
+        with pytest.raises(ValueError):
+            cacheable.failing(1)
+        assert cacheable.calls["failing"] == 2
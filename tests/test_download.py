@@ -0,0 +1,135 @@
+import os
+import time
+
+import pytest
+
+from media_server import DATA, MediaServer
+from vcd.platforms.youtube import download
+from vcd.platforms.youtube.download import FeedFailedException, YoutubeVideoDownloader
+from vcd.platforms.youtube.formats import Format
+from vcd.utils.http import HttpClient
+
+
+class StaticFormats:
+    # Stands in for YoutubeVideoInfo, formats are served by a MediaServer or
+    # never downloaded.
+    def __init__(self, url="http://127.0.0.1:9/videoplayback") -> None:
+        self.url = url
+        self.refreshed = 0
+
+    def format(self, itag=137, mime_type='video/mp4; codecs="avc1.640028"'):
+        return Format(
+            {"itag": itag, "mimeType": mime_type, "contentLength": str(len(DATA))},
+            self.url,
+        )
+
+    def select_formats(self, **kwargs):
+        return self.format(), self.format(140, 'audio/mp4; codecs="mp4a.40.2"')
+
+    def refresh_format(self, format):
+        self.refreshed += 1
+        return format
+
+
+@pytest.fixture
+def media():
+    server = MediaServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(download.time, "sleep", lambda seconds: None)
+
+
+def make_downloader(media, **kwargs):
+    formats = StaticFormats(media.url)
+    kwargs.setdefault("timeout", (1, 0.5))
+    downloader = YoutubeVideoDownloader(
+        formats, HttpClient(None, None, retry=1), **kwargs
+    )
+    return formats, downloader
+
+
+@pytest.mark.parametrize("buffered", [False, True])
+def test_resume_after_drop_and_stall(media, buffered):
+    # On chunk boundaries, a partly filled chunk is not delivered.
+    media.faults = [("drop", 2 * 65536), ("stall", 4 * 65536)]
+    formats, downloader = make_downloader(media)
+    started = time.monotonic()
+    output = b"".join(
+        bytes(x)
+        for x in downloader.iter_stream(
+            formats.format(), buffer=bytearray(65536) if buffered else None
+        )
+    )
+    assert output == DATA
+    assert time.monotonic() - started < 10
+    # Each resume asks for the first byte that was not delivered.
+    assert media.ranges[0] is None
+    assert media.ranges[1] == f"bytes={2 * 65536}-"
+    assert media.ranges[2] == f"bytes={6 * 65536}-"
+
+
+def test_resume_after_short_body(media):
+    media.faults = [("short", 3 * 65536)]
+    formats, downloader = make_downloader(media)
+    output = b"".join(
+        bytes(x) for x in downloader.iter_stream(formats.format(), buffer=bytearray(65536))
+    )
+    assert output == DATA
+    assert media.ranges[1] == f"bytes={3 * 65536}-"
+
+
+def test_resume_ranges_after_stall(media):
+    media.faults = [(None, None), ("stall", 1000)]
+    formats, downloader = make_downloader(media, connections=2)
+    output = b"".join(downloader.iter_stream(formats.format()))
+    assert output == DATA
+
+
+def test_gives_up_after_max_resume_attempts(media):
+    media.faults = [("stall", 0)] * 3
+    formats, downloader = make_downloader(media, max_resume_attempts=2)
+    with pytest.raises(Exception):
+        b"".join(downloader.iter_stream(formats.format()))
+    assert formats.refreshed == 1
+
+
+FAKE_FFMPEG = os.path.join(os.path.dirname(__file__), "fake_ffmpeg.py")
+
+
+def open_fds():
+    return set(os.listdir("/proc/self/fd"))
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_failed_ffmpeg_start_closes_the_pipes(tmp_path):
+    downloader = YoutubeVideoDownloader(
+        StaticFormats(), None, ffmpeg_path=str(tmp_path / "missing-ffmpeg")
+    )
+    before = open_fds()
+    with pytest.raises(FileNotFoundError):
+        next(downloader.merged_stream())
+    assert open_fds() == before
+
+
+def test_merged_stream(media):
+    _, downloader = make_downloader(media, ffmpeg_path=FAKE_FFMPEG)
+    assert b"".join(downloader.merged_stream()) == DATA * 2
+
+
+def test_stuck_feeder_does_not_hang_merged_stream(media, monkeypatch):
+    # ffmpeg exits without reading its inputs while both feeders wait on a
+    # stalled server.
+    monkeypatch.setenv("FAKE_IGNORE_INPUTS", "1")
+    monkeypatch.setenv("FAKE_OUTPUT_BYTES", "1000")
+    media.faults = [("stall", 0), ("stall", 0)]
+    _, downloader = make_downloader(
+        media, ffmpeg_path=FAKE_FFMPEG, feeder_join_timeout=0.5, timeout=(1, 60)
+    )
+    started = time.monotonic()
+    with pytest.raises(FeedFailedException):
+        b"".join(downloader.merged_stream())
+    assert time.monotonic() - started < 5
@@ -0,0 +1,60 @@
+import os
+import time
+
+import pytest
+
+from vcd.utils.ffmpeg import (
+    FFmpegFailedException,
+    FFmpegProcess,
+    FFmpegStalledException,
+)
+
+FAKE_FFMPEG = os.path.join(os.path.dirname(__file__), "fake_ffmpeg.py")
+
+
+@pytest.fixture
+def fake_env(monkeypatch):
+    def set_env(**values):
+        for key, value in values.items():
+            monkeypatch.setenv(key, str(value))
+
+    return set_env
+
+
+def test_output_and_progress(fake_env):
+    fake_env(FAKE_OUTPUT_BYTES=200000)
+    progress = []
+    ffmpeg = FFmpegProcess([FAKE_FFMPEG], on_progress=progress.append).start()
+    output = b"".join(ffmpeg.iter_output(65536))
+    assert len(output) == 200000
+    assert progress[-1]["progress"] == "end"
+    assert progress[-1]["total_size"] == 200000
+    assert progress[0]["speed"] == 1.5
+
+
+def test_failure_is_raised(fake_env):
+    fake_env(FAKE_OUTPUT_BYTES=1000, FAKE_RC=1)
+    ffmpeg = FFmpegProcess([FAKE_FFMPEG]).start()
+    with pytest.raises(FFmpegFailedException):
+        b"".join(ffmpeg.iter_output())
+
+
+def test_stall_while_reading_is_killed(fake_env):
+    fake_env(FAKE_OUTPUT_BYTES=1000000, FAKE_STALL_AFTER=65536)
+    ffmpeg = FFmpegProcess([FAKE_FFMPEG], stall_timeout=0.5).start()
+    started = time.monotonic()
+    with pytest.raises(FFmpegStalledException):
+        b"".join(ffmpeg.iter_output())
+    assert time.monotonic() - started < 5
+
+
+def test_slow_consumer_is_not_a_stall(fake_env):
+    # ffmpeg blocks on its stdout while the consumer is away, that is
+    # backpressure and must not trip the watchdog.
+    fake_env(FAKE_OUTPUT_BYTES=4 * 65536)
+    ffmpeg = FFmpegProcess([FAKE_FFMPEG], stall_timeout=0.3).start()
+    output = 0
+    for chunk in ffmpeg.iter_output(65536):
+        output += len(chunk)
+        time.sleep(0.8)
+    assert output == 4 * 65536
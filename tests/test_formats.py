@@ -0,0 +1,54 @@
+import copy
+import pickle
+
+import pytest
+
+from vcd.platforms.youtube.formats import Format, select_format
+
+
+def make_format(itag=137, mime_type='video/mp4; codecs="avc1.640028"', **raw):
+    return Format({"itag": itag, "mimeType": mime_type, **raw}, f"https://x/{itag}")
+
+
+def test_format_is_immutable():
+    format = make_format(height=1080)
+    with pytest.raises(AttributeError):
+        format.decrypted_url = "changed"
+    with pytest.raises(AttributeError):
+        del format.height
+    with pytest.raises(TypeError):
+        format.raw["itag"] = 1
+    assert format.decrypted_url == "https://x/137"
+    assert format.raw["itag"] == 137
+
+
+def test_replace_makes_a_new_record():
+    format = make_format()
+    replaced = format.replace(decrypted_url="https://y", probe={"reachable": False})
+    assert format.decrypted_url == "https://x/137"
+    assert format.reachable
+    assert replaced.decrypted_url == "https://y"
+    assert not replaced.reachable
+    assert replaced.codec == "avc1.640028"
+
+
+def test_copy_and_pickle():
+    format = make_format(qualityLabel="1080p")
+    assert copy.deepcopy(format) is format
+    unpickled = pickle.loads(pickle.dumps(format))
+    assert unpickled["quality_label"] == "1080p"
+    assert unpickled.sort_key == format.sort_key
+    with pytest.raises(AttributeError):
+        unpickled.url = "changed"
+
+
+def test_select_format():
+    formats = [
+        make_format(137, height=1080, quality="hd1080", bitrate=4000000),
+        make_format(248, 'video/webm; codecs="vp9"', height=1080, quality="hd1080", bitrate=3000000),
+        make_format(136, 'video/mp4; codecs="avc1.4d401f"', height=720, quality="hd720", bitrate=2000000),
+    ]
+    assert select_format(formats).itag == 137
+    assert select_format(formats, max_height=720).itag == 136
+    assert select_format(formats, codecs=("vp9",)).itag == 248
+    assert select_format(formats, codecs=("av01",), strict_codecs=True) is None
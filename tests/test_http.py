@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+import urllib3
+
+from media_server import DATA, MediaServer
+from vcd.utils import http
+from vcd.utils.async_http import AsyncHttpClient
+from vcd.utils.http import HttpClient, RequestFailedException, response_readinto
+
+
+@pytest.fixture
+def media():
+    server = MediaServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(params=["fp", "urllib3"])
+def readinto_path(request, monkeypatch):
+    # Both the http.client fast path and urllib3's own readinto.
+    monkeypatch.setattr(http, "_URLLIB3_FP_READINTO", request.param == "fp")
+    return request.param
+
+
+def read_body(media, **kwargs):
+    buffer = bytearray(65536)
+    output = bytearray()
+    with HttpClient(None, None, retry=1).get(media.url, stream=True, **kwargs) as res:
+        readinto = response_readinto(res)
+        assert (readinto == res.raw.readinto) != http._URLLIB3_FP_READINTO
+        while True:
+            read = readinto(buffer)
+            if not read:
+                return bytes(output)
+            output += buffer[:read]
+
+
+def test_readinto(media, readinto_path):
+    assert read_body(media) == DATA
+
+
+def test_readinto_truncated_body(media, readinto_path):
+    media.faults = [("short", 100000)]
+    with pytest.raises(urllib3.exceptions.ProtocolError):
+        read_body(media)
+
+
+def test_readinto_timeout(media, readinto_path):
+    media.faults = [("stall", 100000)]
+    with pytest.raises(urllib3.exceptions.ReadTimeoutError):
+        read_body(media, timeout=(1, 0.3))
+
+
+@pytest.mark.parametrize("retry, requests", [(None, 3), (1, 1), (2, 2)])
+def test_retry_override(media, retry, requests):
+    with pytest.raises(RequestFailedException):
+        HttpClient(None, None, retry=3).get(media.url, accepted_status={204}, retry=retry)
+    assert len(media.ranges) == requests
+
+
+@pytest.mark.parametrize("retry, requests", [(None, 3), (1, 1), (2, 2)])
+def test_async_retry_override(media, retry, requests):
+    async def get():
+        async with AsyncHttpClient(None, None, retry=3) as client:
+            await client.get(media.url, accepted_status={204}, retry=retry)
+
+    with pytest.raises(RequestFailedException):
+        asyncio.run(get())
+    assert len(media.ranges) == requests
+
+
+def test_async_get(media):
+    async def get():
+        async with AsyncHttpClient(None, None) as client:
+            res = await client.get(media.url, retry=1)
+            return await res.read()
+
+    assert asyncio.run(get()) == DATA
@@ -0,0 +1,43 @@
+import shutil
+import time
+
+import pytest
+
+from vcd.utils.js import JsCallFailedException, NodeJsRuntime
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+
+SOURCE = """
+function reverse(a) { return String(a).split("").reverse().join(""); }
+function hang(a) { while (true) {} }
+"""
+
+
+@pytest.fixture
+def runtime():
+    runtime = NodeJsRuntime(shutil.which("node"), timeout=1)
+    yield runtime
+    runtime.close()
+
+
+def test_call_many(runtime):
+    assert runtime.call_many(SOURCE, "reverse", ["abc", "xyz"]) == ["cba", "zyx"]
+    # A long answer arrives over several reads.
+    assert runtime.call(SOURCE, "reverse", "a" * 200000) == "a" * 200000
+
+
+def test_hung_call_is_killed_and_the_runtime_restarts(runtime):
+    runtime.call(SOURCE, "reverse", "abc")
+    pid = runtime._process.pid
+    started = time.monotonic()
+    with pytest.raises(JsCallFailedException):
+        runtime.call(SOURCE, "hang", "abc")
+    assert time.monotonic() - started < 3
+    assert runtime.call(SOURCE, "reverse", "abc") == "cba"
+    assert runtime._process.pid != pid
+
+
+def test_js_error(runtime):
+    with pytest.raises(JsCallFailedException):
+        runtime.call(SOURCE, "missing", "abc")
+    assert runtime.call(SOURCE, "reverse", "abc") == "cba"
@@ -0,0 +1,48 @@
+from vcd.platforms.youtube.formats import Format
+from vcd.platforms.youtube.mux import plan_mux
+
+
+def make_format(mime_type, **raw):
+    return Format({"mimeType": mime_type, **raw})
+
+
+AVC_1080 = make_format('video/mp4; codecs="avc1.640028"', width=1920, height=1080, fps=30)
+VP9_2160 = make_format('video/webm; codecs="vp9"', width=3840, height=2160, fps=30)
+AV1_1080 = make_format('video/mp4; codecs="av01.0.08M.08"', width=1920, height=1080, fps=30)
+AAC = make_format('audio/mp4; codecs="mp4a.40.2"')
+OPUS = make_format('audio/webm; codecs="opus"')
+
+
+def test_flv_copies_video():
+    for video in (AVC_1080, VP9_2160, AV1_1080):
+        plan = plan_mux(video, OPUS, ("flv",))
+        assert plan.copy_video
+        assert not plan.copy_audio
+        assert plan.ffmpeg_output_args()[:2] == ["-c:v", "copy"]
+
+
+def test_copy_when_possible():
+    plan = plan_mux(AVC_1080, AAC, ("flv",))
+    assert plan.copy_video and plan.copy_audio
+    assert plan.cpu_cost == 0
+
+
+def test_cheapest_container_wins():
+    plan = plan_mux(VP9_2160, OPUS, ("flv", "mp4"))
+    assert plan.container == "mp4"
+    assert plan.cpu_cost == 0
+
+
+def test_video_encode_cost_scales_with_resolution():
+    uhd = plan_mux(
+        make_format('video/webm; codecs="vp9"', width=3840, height=2160, fps=60),
+        AAC,
+        ("mpegts",),
+    )
+    hd = plan_mux(
+        make_format('video/webm; codecs="vp9"', width=1920, height=1080, fps=30),
+        AAC,
+        ("mpegts",),
+    )
+    assert not uhd.copy_video
+    assert uhd.cpu_cost == 8 * hd.cpu_cost
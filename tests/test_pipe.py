@@ -0,0 +1,79 @@
+import os
+import threading
+
+import pytest
+
+from vcd.utils import pipe
+from vcd.utils.pipe import copy_fd, set_pipe_size, write_all
+
+DATA = os.urandom(3 * 1024 * 1024 + 123)
+
+
+def read_all(fd):
+    return b"".join(iter(lambda: os.read(fd, 1 << 20), b""))
+
+
+def test_write_all_retries_short_writes(monkeypatch):
+    real_write = os.write
+    sizes = []
+
+    def short_write(fd, data):
+        sizes.append(len(data))
+        return real_write(fd, data[:1000])
+
+    monkeypatch.setattr(pipe.os, "write", short_write)
+    read_fd, write_fd = os.pipe()
+    reader_output = []
+    reader = threading.Thread(target=lambda: reader_output.append(read_all(read_fd)))
+    reader.start()
+    write_all(write_fd, memoryview(DATA)[:100000])
+    os.close(write_fd)
+    reader.join()
+    os.close(read_fd)
+    assert reader_output[0] == DATA[:100000]
+    assert len(sizes) == 100
+
+
+def copy_through(tmp_path, source_is_pipe, monkeypatch=None):
+    output_path = tmp_path / "output"
+    if source_is_pipe:
+        src_fd, write_fd = os.pipe()
+        set_pipe_size(write_fd)
+        writer = threading.Thread(
+            target=lambda: (write_all(write_fd, DATA), os.close(write_fd))
+        )
+        writer.start()
+    else:
+        input_path = tmp_path / "input"
+        input_path.write_bytes(DATA)
+        src_fd = os.open(input_path, os.O_RDONLY)
+    dst_fd = os.open(output_path, os.O_WRONLY | os.O_CREAT)
+    try:
+        copied = copy_fd(src_fd, dst_fd, 64 * 1024)
+    finally:
+        os.close(src_fd)
+        os.close(dst_fd)
+    if source_is_pipe:
+        writer.join()
+    assert copied == len(DATA)
+    assert output_path.read_bytes() == DATA
+
+
+@pytest.mark.skipif(not hasattr(os, "splice"), reason="needs os.splice")
+def test_copy_fd_splices_from_a_pipe(tmp_path, monkeypatch):
+    spliced = []
+    real_splice = os.splice
+    monkeypatch.setattr(
+        pipe.os, "splice", lambda *args: spliced.append(1) or real_splice(*args)
+    )
+    copy_through(tmp_path, source_is_pipe=True)
+    assert spliced
+
+
+def test_copy_fd_falls_back_to_read_and_write(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipe, "can_splice", lambda src_fd, dst_fd: False)
+    copy_through(tmp_path, source_is_pipe=True)
+
+
+def test_copy_fd_between_files(tmp_path):
+    copy_through(tmp_path, source_is_pipe=False)
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from vcd.utils.stream import ByteQueue
+
+
+def test_bytes_arrive_in_order():
+    queue = ByteQueue(max_bytes=1024, coalesce_size=64)
+    data = bytes(range(256)) * 40
+
+    def write():
+        for i in range(0, len(data), 100):
+            queue.write(data[i : i + 100])
+        queue.close()
+
+    threading.Thread(target=write, daemon=True).start()
+    assert b"".join(queue) == data
+    assert queue.stats()["high_water_mark"] <= 1024
+
+
+def test_readinto():
+    queue = ByteQueue()
+    queue.write(b"abc")
+    queue.write(b"def")
+    queue.close()
+    buffer = bytearray(4)
+    assert queue.readinto(buffer) == 4
+    assert buffer == b"abcd"
+    assert queue.read() == b"ef"
+    assert queue.read(10) == b""
+
+
+def test_writer_blocks_until_there_is_room():
+    queue = ByteQueue(max_bytes=10)
+    queue.write(b"x" * 8)
+    written = threading.Event()
+
+    def write():
+        queue.write(b"y" * 5)
+        written.set()
+
+    threading.Thread(target=write, daemon=True).start()
+    assert not written.wait(0.2)
+    assert queue.read(8) == b"x" * 8
+    assert written.wait(1)
+
+
+def test_write_after_close():
+    queue = ByteQueue()
+    queue.close()
+    with pytest.raises(ValueError):
+        queue.write(b"x")
+
+
+def test_abort_is_a_broken_pipe_for_every_writer():
+    queue = ByteQueue(max_bytes=4)
+    queue.write(b"xxxx")
+    errors = []
+
+    def write():
+        try:
+            queue.write(b"y")
+        except BrokenPipeError as e:
+            errors.append(e)
+
+    blocked = threading.Thread(target=write, daemon=True)
+    blocked.start()
+    time.sleep(0.1)
+    queue.abort()
+    blocked.join(1)
+    assert len(errors) == 1
+    # Also for writes arriving after the abort.
+    with pytest.raises(BrokenPipeError):
+        queue.write(b"z")
@@ -0,0 +1,115 @@
+import os
+import threading
+
+import pytest
+
+from scotty_server import RESOURCE_ID, ScottyServer
+from vcd.platforms.youtube import upload
+from vcd.platforms.youtube.upload import YoutubeVideoUploader
+from vcd.utils.http import HttpClient, RequestFailedException
+from vcd.utils.stateful import Stateful
+from vcd.utils.stream import ByteQueue
+
+DATA = os.urandom(3 * 1024 * 1024 + 12345)
+
+
+@pytest.fixture
+def scotty():
+    server = ScottyServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(upload.time, "sleep", lambda seconds: None)
+
+
+def make_uploader(scotty, **kwargs):
+    class Uploader(YoutubeVideoUploader):
+        _UPLOAD_START_URL = scotty.start_url
+
+        def get_info(self):
+            return {}
+
+    return Uploader({}, HttpClient(None, None), chunk_size=1024 * 1024, **kwargs)
+
+
+def upload_and_check(scotty, data=DATA, input_stream=None, **kwargs):
+    stateful = Stateful()
+    resource_id = make_uploader(scotty, **kwargs).upload(
+        data if input_stream is None else input_stream, stateful
+    )
+    assert resource_id == RESOURCE_ID
+    assert stateful.get() == RESOURCE_ID
+    assert bytes(scotty.data) == data
+    assert scotty.status == "final"
+
+
+def test_upload_in_chunks(scotty):
+    upload_and_check(scotty)
+    upload_commands = [x for x in scotty.commands if x[0].startswith("upload")]
+    assert [offset for _, offset in upload_commands] == [
+        i * 1024 * 1024 for i in range(4)
+    ]
+    assert upload_commands[-1][0] == "upload, finalize"
+
+
+def test_resume_after_drop_with_partial_commit(scotty):
+    scotty.faults = ["drop"]
+    upload_and_check(scotty)
+    queries = [x for x in scotty.commands if x[0] == "query"]
+    assert len(queries) == 1
+    # Half of the first chunk was committed, only the rest is sent again.
+    resumed = scotty.commands[scotty.commands.index(queries[0]) + 1]
+    assert resumed == ("upload", 512 * 1024)
+
+
+def test_resume_after_errors_and_drops(scotty):
+    scotty.faults = ["error", "drop", "drop", "error"]
+    upload_and_check(scotty)
+
+
+def test_lost_final_response_is_recovered_by_query(scotty):
+    scotty.faults = [None, None, None, "lose_final"]
+    upload_and_check(scotty)
+    assert scotty.commands[-1][0] == "query"
+
+
+def test_disk_spool(scotty):
+    scotty.faults = ["drop"]
+    upload_and_check(scotty, spool_memory_size=1000)
+
+
+def test_stream_ending_on_a_chunk_boundary(scotty):
+    data = DATA[: 2 * 1024 * 1024]
+    upload_and_check(scotty, data)
+    assert scotty.commands[-1] == ("upload, finalize", len(data))
+
+
+def test_iterable_input(scotty):
+    scotty.faults = ["drop"]
+    pieces = (DATA[i : i + 70000] for i in range(0, len(DATA), 70000))
+    upload_and_check(scotty, input_stream=pieces)
+
+
+def test_byte_queue_input(scotty):
+    queue = ByteQueue(max_bytes=512 * 1024)
+
+    def write():
+        for i in range(0, len(DATA), 100000):
+            queue.write(DATA[i : i + 100000])
+        queue.close()
+
+    threading.Thread(target=write, daemon=True).start()
+    scotty.faults = ["drop"]
+    upload_and_check(scotty, input_stream=queue)
+
+
+def test_failure_is_published(scotty):
+    scotty.faults = ["error"] * 10
+    stateful = Stateful()
+    with pytest.raises(RequestFailedException):
+        make_uploader(scotty, max_resume_attempts=2).upload(DATA, stateful)
+    with pytest.raises(RequestFailedException):
+        stateful.get(block=True, timeout=1)
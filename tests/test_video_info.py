@@ -0,0 +1,64 @@
+import logging
+import shutil
+
+import pytest
+
+from vcd.platforms.youtube.player import YoutubePlayerStore
+from vcd.utils.http import HttpClient
+from vcd.utils.js import ExecJsRuntime, JsRuntime, NodeJsRuntime
+from vcd.utils.url import URL
+from youtube_server import PLAYER_JS_WITHOUT_N, YoutubeServer, video_info_class
+
+
+@pytest.fixture
+def js_runtime():
+    node_path = shutil.which("node")
+    runtime = NodeJsRuntime(node_path) if node_path else ExecJsRuntime()
+    previous = JsRuntime._default
+    JsRuntime.set_default(runtime)
+    yield runtime
+    JsRuntime.set_default(previous)
+    runtime.close()
+
+
+def make_video_info(server, video_id="video1"):
+    return video_info_class(server)(
+        video_id,
+        HttpClient(None, None, retry=1),
+        player_store=YoutubePlayerStore(),
+        format_probe=None,
+    )
+
+
+def n_values(formats):
+    return {format.itag: URL(format.decrypted_url).query_dict["n"][0] for format in formats}
+
+
+def test_n_values_are_decrypted_in_one_round_trip(js_runtime):
+    server = YoutubeServer().start()
+    try:
+        video_info = make_video_info(server)
+        formats = video_info.adaptive_formats
+    finally:
+        server.stop()
+    assert n_values(formats["video"] + formats["audio"]) == {
+        137: "731n",
+        248: "842n",
+        136: "631n",
+        140: "041n",
+        251: "152n",
+    }
+    assert js_runtime.stats()["calls"] == 1
+    assert js_runtime.stats()["items"] == 5
+
+
+def test_missing_n_function_is_logged(js_runtime, caplog):
+    server = YoutubeServer(player_js=PLAYER_JS_WITHOUT_N).start()
+    try:
+        with caplog.at_level(logging.WARNING):
+            formats = make_video_info(server).adaptive_formats
+    finally:
+        server.stop()
+    assert set(n_values(formats["video"]).values()) == {"n137", "n248", "n136"}
+    assert js_runtime.stats()["calls"] == 0
+    assert any("No n function found" in x.getMessage() for x in caplog.records)
@@ -0,0 +1,89 @@
+import json
+import os
+import re
+
+import pytest
+
+from vcd.platforms.youtube.watch_page import extract_watch_page
+
+WATCH_PAGES = os.path.join(os.path.dirname(__file__), "watch_pages")
+
+# The per-field regexes YoutubeVideoInfo used before extract_watch_page, kept
+# as the reference the single scan has to agree with.
+_PLAYER_RESPONSE_RE = re.compile(
+    r"ytInitialPlayerResponse\s*=\s*({.+?})\s*;(?:var\s+meta|</script|\n)"
+)
+_PLAYER_JS_RE = re.compile(r"\"(?:PLAYER_JS_URL|jsUrl)\"\s*:\s*\"([^\"]+)\"")
+_YTCFG_RE = re.compile(r"ytcfg\.set\s*\(\s*({.+?})\s*\)\s*;")
+_TITLE_RE = re.compile(
+    r"(?isx)<meta(?=[^>]+(?:itemprop|name|property|id|http-equiv)=([\"\']?)(?:og:title|twitter:title|title)\1)[^>]+?content=([\"\'])(?P<content>.*?)\2"
+)
+
+
+def old_extract_watch_page(src):
+    player_response = _PLAYER_RESPONSE_RE.search(src)
+    player_js = _PLAYER_JS_RE.search(src)
+    yt_cfg = _YTCFG_RE.search(src)
+    title = _TITLE_RE.search(src)
+    return {
+        "player_response": json.loads(player_response.group(1)) if player_response else None,
+        "yt_cfg": json.loads(yt_cfg.group(1)) if yt_cfg else None,
+        "player_js_url": player_js.group(1) if player_js else None,
+        "title": title.group("content") if title else None,
+    }
+
+
+def read_watch_page(name):
+    with open(os.path.join(WATCH_PAGES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name", sorted(os.listdir(WATCH_PAGES)))
+def test_matches_old_extractor(name):
+    src = read_watch_page(name)
+    page = extract_watch_page(src)
+    assert page == old_extract_watch_page(src)
+    assert all(page[field] is not None for field in page)
+
+
+def test_nested_js_url():
+    page = extract_watch_page(read_watch_page("nested_js_url.html"))
+    assert page["player_js_url"] == "/s/player/3c3a4fdb/player_ias.vflset/en_GB/base.js"
+    assert page["yt_cfg"]["STS"] == 19787
+    assert page["title"] == "Rick Astley - Never Gonna Give You Up (Official Music Video)"
+
+
+def test_anchors_inside_player_response():
+    # Only the player response carries the player url and the title meta, at
+    # some depth, so both are inside the object the scan skips.
+    player_response = {
+        "videoDetails": {"videoId": "abc", "title": "Nested"},
+        "embed": {"config": {"jsUrl": "/s/player/0011aabb/base.js"}},
+        "html": "<meta property='og:title' content='Nested title'>",
+    }
+    src = f"<script>var ytInitialPlayerResponse = {json.dumps(player_response)};</script>"
+    page = extract_watch_page(src)
+    assert page == old_extract_watch_page(src)
+    assert page["player_js_url"] == "/s/player/0011aabb/base.js"
+    assert page["title"] == "Nested title"
+
+
+def test_first_occurrence_wins():
+    # The url inside the earlier object comes before the top-level one after it.
+    src = (
+        'ytcfg.set({"A": {"jsUrl": "/first.js"}});'
+        '"PLAYER_JS_URL": "/second.js" '
+        'ytcfg.set({"PLAYER_JS_URL": "/third.js"});'
+    )
+    page = extract_watch_page(src)
+    assert page["player_js_url"] == old_extract_watch_page(src)["player_js_url"] == "/first.js"
+    assert page["yt_cfg"] == {"A": {"jsUrl": "/first.js"}}
+
+
+def test_missing_fields():
+    assert extract_watch_page("<html><body>nothing here</body></html>") == {
+        "player_response": None,
+        "yt_cfg": None,
+        "player_js_url": None,
+        "title": None,
+    }
@@ -0,0 +1,142 @@
+# Local stand-in for the youtube.com pages a YoutubeVideoInfo reads: the watch
+# page, the player js and the player api. Formats point at /videoplayback on
+# the same server with an n parameter of "n" followed by their itag, which the
+# player's n function reverses.
+import http.server
+import json
+import socketserver
+import threading
+import urllib.parse
+
+PLAYER_ID = "abcdef12"
+
+PLAYER_JS = """var foo=1;a.D&&(b=a.get("n"))&&(b=Xy[0](b),a.set("n",b));
+var Xy=[abc];
+abc=function(a){return String(a).split("").reverse().join("")};
+var sts=19834;
+"""
+
+# Same player without the n function call site.
+PLAYER_JS_WITHOUT_N = """var foo=1;
+var sts=19834;
+"""
+
+FORMATS = [
+    (137, 'video/mp4; codecs="avc1.640028"', "hd1080", None, 4000000),
+    (248, 'video/webm; codecs="vp9"', "hd1080", None, 3000000),
+    (136, 'video/mp4; codecs="avc1.4d401f"', "hd720", None, 2000000),
+    (140, 'audio/mp4; codecs="mp4a.40.2"', "tiny", "AUDIO_QUALITY_MEDIUM", 130000),
+    (251, 'audio/webm; codecs="opus"', "tiny", "AUDIO_QUALITY_MEDIUM", 140000),
+]
+
+
+class YoutubeServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, player_js=PLAYER_JS) -> None:
+        super().__init__(("127.0.0.1", 0), _YoutubeHandler)
+        self.player_js = player_js
+        self.requests = []
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> "YoutubeServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def player_response(self, video_id):
+        formats = []
+        for itag, mime_type, quality, audio_quality, bitrate in FORMATS:
+            format = {
+                "itag": itag,
+                "url": f"{self.base_url}/videoplayback?id={video_id}&itag={itag}&n=n{itag}",
+                "mimeType": mime_type,
+                "quality": quality,
+                "bitrate": bitrate,
+                "contentLength": "102400",
+            }
+            if audio_quality:
+                format["audioQuality"] = audio_quality
+            else:
+                height = 1080 if quality == "hd1080" else 720
+                format.update(height=height, width=height * 16 // 9, fps=30)
+            formats.append(format)
+        return {
+            "playabilityStatus": {"status": "OK"},
+            "videoDetails": {"videoId": video_id, "title": f"Video {video_id}"},
+            "streamingData": {"adaptiveFormats": formats, "expiresInSeconds": "21540"},
+        }
+
+    def watch_page(self, video_id):
+        player_js_url = f"{self.base_url}/s/player/{PLAYER_ID}/player_ias.vflset/en_US/base.js"
+        return (
+            f'<html><head><meta property="og:title" content="Video {video_id}"></head><body>'
+            f'<script>ytcfg.set({{"STS": 19834, "PLAYER_JS_URL": "{player_js_url}"}});</script>'
+            f"<script>var ytInitialPlayerResponse = {json.dumps(self.player_response(video_id))};</script>"
+            "</body></html>"
+        )
+
+
+class _YoutubeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="text/html"):
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        server: YoutubeServer = self.server
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        server.requests.append(url.path)
+        if url.path == "/watch":
+            return self._send(200, server.watch_page(query["v"][0]))
+        if url.path.endswith("/base.js"):
+            return self._send(200, server.player_js, "text/javascript")
+        if url.path == "/videoplayback":
+            return self._send(200, b"x" * 1024, "video/mp4")
+        self._send(404)
+
+    def do_POST(self):
+        server: YoutubeServer = self.server
+        url = urllib.parse.urlparse(self.path)
+        server.requests.append(url.path)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if url.path == "/youtubei/v1/player":
+            return self._send(
+                200,
+                json.dumps(server.player_response(body["videoId"])),
+                "application/json",
+            )
+        self._send(404)
+
+
+def video_info_class(server: YoutubeServer):
+    from vcd.platforms.youtube.video_info import YoutubeVideoInfo
+
+    class LocalYoutubeVideoInfo(YoutubeVideoInfo):
+        _PLAYER_API_URL = f"{server.base_url}/youtubei/v1/player"
+
+        @property
+        def watch_url(self):
+            return f"{server.base_url}/watch?v={self.video_id}"
+
+    return LocalYoutubeVideoInfo
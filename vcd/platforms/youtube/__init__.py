@@ -1,4 +1,4 @@
 from vcd.platforms.youtube.auth import YouTubeOAuth2Client, YouTubeAuthClient
 from vcd.platforms.youtube.video_info import YoutubeVideoInfo
 from vcd.platforms.youtube.download import YoutubeVideoDownloader
-from vcd.platforms.youtube.upload import YoutubeVideoUploader
+from vcd.platforms.youtube.upload import YoutubeVideoUploader, YoutubeUploadSession
@@ -153,8 +153,9 @@ class YouTubeAuthClient:
                     '//button[.//span[text()="Next"]]', by="xpath"
                 ).click()
 
+            # Woken by the cdp listener as soon as the token is seen.
             session_token = session_token_stateful.get(
-                block=True, is_timeout=is_timeout
+                block=True, timeout=timeout, is_timeout=is_timeout
             )
             required_cookies = {
                 "SID",
@@ -1,93 +1,299 @@
 from vcd.platforms.youtube.video_info import YoutubeVideoInfo
-from vcd.utils.http import HttpClient
-import subprocess
+from vcd.platforms.youtube.mux import CONTAINER_CODECS, plan_mux
+from vcd.utils.http import HttpClient, RequestFailedException, response_readinto
+from vcd.utils.ffmpeg import FFmpegProcess
+from vcd.utils.pipe import copy_fd, set_pipe_size, write_all
+from vcd.utils.url import URL
+import http.client
+import requests
+import urllib3
 import os
-import shlex
 import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class FeedFailedException(Exception):
+    pass
+
+
 class YoutubeVideoDownloader:
     def __init__(
         self,
         youtube_video_info: YoutubeVideoInfo,
         http_client: HttpClient,
         ffmpeg_path="tools/ffmpeg",
+        format_selection=None,
+        connections=1,
+        max_resume_attempts=5,
+        pipe_size=1024 * 1024,
+        containers=("flv",),
+        prefer_copy=False,
+        on_progress=None,
+        stall_timeout=60,
+        feeder_join_timeout=10,
+        timeout=(10, 30),
     ) -> None:
         self._http_client = http_client
         self._yvi = youtube_video_info
         self._ffmpeg_path = ffmpeg_path
+        # Keyword arguments for YoutubeVideoInfo.select_formats, the best
+        # formats are used when it is not set.
+        self._format_selection = format_selection or {}
+        # Range requests per stream, one keeps the plain sequential download.
+        self._connections = connections
+        self._max_resume_attempts = max_resume_attempts
+        self._pipe_size = pipe_size
+        # Output containers acceptable to the caller, in order of preference.
+        # With prefer_copy, the caller allows formats that can be muxed without
+        # re-encoding to be picked over the best ones.
+        self._containers = tuple(containers)
+        self._prefer_copy = prefer_copy
+        self.mux_plan = None
+        # Called with the parsed ffmpeg -progress metrics, about every second.
+        self._on_progress = on_progress
+        self._stall_timeout = stall_timeout
+        self._feeder_join_timeout = feeder_join_timeout
+        # (connect, read) seconds for the stream requests, a stalled connection
+        # times out and is resumed like a broken one.
+        self._timeout = timeout
 
     @staticmethod
     def save_pipe(file_name, stream_out):
-        output = 0
+        # Spliced in the kernel when stream_out is a pipe.
         with open(file_name, "wb") as f:
+            output = copy_fd(stream_out.fileno(), f.fileno())
+        logger.info(f"Output: {output}")
+
+    def _open_stream(self, url, offset, content_length, chunk_size, buffer=None):
+        if self._connections > 1:
+            return self._http_client.iter_ranges(
+                url,
+                content_length=content_length,
+                connections=self._connections,
+                start=offset,
+                timeout=self._timeout,
+            )
+        return self._iter_sequential(url, offset, chunk_size, buffer)
+
+    def _iter_sequential(self, url, offset, chunk_size, buffer=None):
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with self._http_client.get(
+            url,
+            stream=True,
+            headers=headers,
+            accepted_status={206} if offset else {200},
+            timeout=self._timeout,
+        ) as res:
+            if buffer is None:
+                yield from res.iter_content(chunk_size=chunk_size)
+                return
+            readinto = response_readinto(res)
+            view = memoryview(buffer)
             while True:
-                chunk = stream_out.read(1024000)
-                if chunk == b"":
-                    break
-                output += 1024000
-                f.write(chunk)
-                logger.info(f"Output: {output}")
-
-    def feed_pipe(self, url, write_fd, chunk_size=65536):
-        with self._http_client.get(url, stream=True) as res:
-            with os.fdopen(write_fd, "wb", closefd=True) as pipe:
-                cl = int(res.headers.get("Content-Length", -1))
-                downloaded = 0
-                for chunk in res.iter_content(chunk_size=chunk_size):
+                read = readinto(view)
+                if not read:
+                    return
+                yield view[:read]
+
+    @staticmethod
+    def _url_expires_soon(url, margin=30):
+        expire = URL(url).query_dict.get("expire")
+        return expire is not None and int(expire[0]) - time.time() < margin
+
+    def iter_stream(self, stream_info, chunk_size=65536, buffer=None):
+        # Yields the whole stream, reopening it from the last delivered byte when
+        # the connection breaks. Expired or repeatedly failing urls are resolved
+        # again through the video info. With a buffer, sequential downloads are
+        # read into it and yield views of it, valid until the next chunk.
+        content_length = self._content_length(stream_info)
+        offset = 0
+        failures = 0
+        while True:
+            try:
+                for chunk in self._open_stream(
+                    stream_info["decrypted_url"],
+                    offset,
+                    content_length,
+                    chunk_size,
+                    buffer,
+                ):
                     if chunk:
-                        curr_chunk_size = len(chunk)
-                        downloaded += curr_chunk_size
-                        if (
-                            downloaded % (chunk_size * 10) == 0
-                            or curr_chunk_size < chunk_size
-                        ):
-                            logger.info(
-                                f"Downloaded {downloaded}/{cl}({int(downloaded/cl * 100)}%)"
-                            )
-                        pipe.write(chunk)
+                        offset += len(chunk)
+                        failures = 0
+                        yield chunk
+                if content_length is None or offset >= content_length:
+                    return
+                raise RequestFailedException(
+                    f"Stream ended at {offset}/{content_length}"
+                )
+            except (
+                requests.RequestException,
+                RequestFailedException,
+                http.client.HTTPException,
+                urllib3.exceptions.ProtocolError,
+                urllib3.exceptions.ReadTimeoutError,
+                ConnectionError,
+                TimeoutError,
+            ) as e:
+                failures += 1
+                if failures > self._max_resume_attempts:
+                    raise
+                logger.warn(
+                    f"Stream of itag {stream_info['itag']} failed at {offset}/{content_length}, resuming... {failures}/{self._max_resume_attempts}: {e}"
+                )
+                if failures > 1 or self._url_expires_soon(
+                    stream_info["decrypted_url"]
+                ):
+                    stream_info = self._yvi.refresh_format(stream_info)
+                time.sleep(min(2 ** (failures - 1), 30))
+
+    def feed_pipe(self, stream_info, write_fd, chunk_size=65536, stop_event=None):
+        # Chunks go to the fd with os.write, without a file object in between.
+        content_length = self._content_length(stream_info)
+        buffer = bytearray(chunk_size)
+        downloaded = 0
+        logged = 0
+        try:
+            for chunk in self.iter_stream(
+                stream_info, chunk_size=chunk_size, buffer=buffer
+            ):
+                if stop_event is not None and stop_event.is_set():
+                    return
+                downloaded += len(chunk)
+                if downloaded - logged >= chunk_size * 10 or downloaded == content_length:
+                    logged = downloaded
+                    logger.info(f"Downloaded {downloaded}/{content_length}")
+                write_all(write_fd, chunk)
+        finally:
+            os.close(write_fd)
+
+    def _supervised_feed(self, stream_info, write_fd, stop_event, errors):
+        try:
+            self.feed_pipe(stream_info, write_fd, stop_event=stop_event)
+        except BrokenPipeError:
+            if not stop_event.is_set():
+                logger.warn(f"ffmpeg closed the input of itag {stream_info['itag']}")
+        except Exception as e:
+            if not stop_event.is_set():
+                logger.error(f"Feed of itag {stream_info['itag']} failed: {e}")
+                errors.append(e)
+
+    @staticmethod
+    def _content_length(stream_info):
+        content_length = stream_info.get("content_length")
+        return int(content_length) if content_length else None
+
+    def _copyable_selection(self, container):
+        codecs = CONTAINER_CODECS[container]
+        return {
+            **self._format_selection,
+            "video_codecs": (
+                *codecs["video"],
+                *self._format_selection.get("video_codecs", ()),
+            ),
+            "audio_codecs": (
+                *codecs["audio"],
+                *self._format_selection.get("audio_codecs", ()),
+            ),
+        }
+
+    def plan_formats(self):
+        candidates = [self._yvi.select_formats(**self._format_selection)]
+        if self._prefer_copy:
+            candidates += [
+                self._yvi.select_formats(**self._copyable_selection(container))
+                for container in self._containers
+            ]
+        # The caller's selection wins ties.
+        return min(
+            (
+                (video, audio, plan_mux(video, audio, self._containers))
+                for video, audio in candidates
+            ),
+            key=lambda x: x[2].cpu_cost,
+        )
 
     def merged_stream(self):
-        video_stream_info = self._yvi.video_formats[0]
-        audio_stream_info = self._yvi.audio_formats[0]
+        video_stream_info, audio_stream_info, self.mux_plan = self.plan_formats()
+        logger.info(
+            f"Muxing video {video_stream_info['itag']} ({video_stream_info.codec}) and audio {audio_stream_info['itag']} ({audio_stream_info.codec}) with {self.mux_plan}, expected cpu cost {self.mux_plan.cpu_cost:.2f} cores"
+        )
         video_read_fd, video_write_fd = os.pipe()
         audio_read_fd, audio_write_fd = os.pipe()
-        command = f"{self._ffmpeg_path} -y -f {video_stream_info['mime_info']['ext']} -i pipe:{video_read_fd} -i pipe:{audio_read_fd} -c:v copy -c:a aac -f flv -flvflags no_duration_filesize -"
-        # command = f"{self._ffmpeg_path} -y -f {video_stream_info['mime_info']['ext']} -i pipe:{video_read_fd} -i pipe:{audio_read_fd} -c:v copy -c:a aac -f mpegts -"
-        process = subprocess.Popen(
-            shlex.split(command),
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=False,
-            close_fds=True,
+        for fd in (video_write_fd, audio_write_fd):
+            set_pipe_size(fd, self._pipe_size)
+        command = [
+            self._ffmpeg_path,
+            "-y",
+            "-f",
+            video_stream_info["mime_info"]["ext"],
+            "-i",
+            f"pipe:{video_read_fd}",
+            "-i",
+            f"pipe:{audio_read_fd}",
+            *self.mux_plan.ffmpeg_output_args(),
+            "-",
+        ]
+        ffmpeg = FFmpegProcess(
+            command,
             pass_fds=(video_read_fd, audio_read_fd),
+            on_progress=self._on_progress,
+            stall_timeout=self._stall_timeout,
         )
+        try:
+            ffmpeg.start()
+        except Exception:
+            os.close(video_write_fd)
+            os.close(audio_write_fd)
+            raise
+        finally:
+            # ffmpeg holds its own copies, the feeders see EPIPE if it exits.
+            os.close(video_read_fd)
+            os.close(audio_read_fd)
+        set_pipe_size(ffmpeg.stdout_fd, self._pipe_size)
 
-        video_pipe_thread = threading.Thread(
-            target=self.feed_pipe,
-            args=(video_stream_info["decrypted_url"], video_write_fd),
-        )
-        audio_pipe_thread = threading.Thread(
-            target=self.feed_pipe,
-            args=(audio_stream_info["decrypted_url"], audio_write_fd),
-        )
-
-        video_pipe_thread.start()
-        audio_pipe_thread.start()
+        stop_event = threading.Event()
+        feeder_errors = []
+        feeders = [
+            threading.Thread(
+                target=self._supervised_feed,
+                args=(stream_info, write_fd, stop_event, feeder_errors),
+                daemon=True,
+            )
+            for stream_info, write_fd in (
+                (video_stream_info, video_write_fd),
+                (audio_stream_info, audio_write_fd),
+            )
+        ]
+        for feeder in feeders:
+            feeder.start()
 
         output = 0
         try:
-            while True:
-                chunk = process.stdout.read(1024000)
-                if chunk == b"":
-                    break
-                output += 1024000
-                logger.info(f"Output: {output}")
+            for chunk in ffmpeg.iter_output(self._pipe_size):
+                output += len(chunk)
+                logger.debug(f"Output: {output}")
                 yield chunk
+            # ffmpeg has exited, a feeder still running is stuck, for example
+            # in a network read, and its input was not read to the end.
+            for feeder in feeders:
+                feeder.join(self._feeder_join_timeout)
+                if feeder.is_alive():
+                    raise FeedFailedException(
+                        f"Feeder {feeder.name} did not finish {self._feeder_join_timeout}s after ffmpeg exited"
+                    )
+            # ffmpeg exits normally on a truncated input, so a failed feed is
+            # only noticed here.
+            if feeder_errors:
+                raise feeder_errors[0]
         finally:
-            video_pipe_thread.join()
-            audio_pipe_thread.join()
+            # Also runs when the consumer stops iterating early.
+            stop_event.set()
+            ffmpeg.stop()
+            for feeder in feeders:
+                feeder.join(self._feeder_join_timeout)
+                if feeder.is_alive():
+                    logger.warn(f"Feeder {feeder.name} is still running after stop")
@@ -0,0 +1,200 @@
+from types import MappingProxyType
+from typing import Iterable, List, Optional, Sequence
+import re
+
+_MIME_TYPE_RE = re.compile(
+    r"((?P<type>[^/]+)/(?P<ext>[^;]+))(?:;\s*codecs=\"(?P<codec>[^\"]+)\")?"
+)
+
+QUALITY_PREF = [
+    "tiny",
+    "small",
+    "medium",
+    "large",
+    "hd720",
+    "hd1080",
+    "hd1440",
+    "hd2160",
+    "hd2880",
+    "highres",
+]
+AUDIO_QUALITY_PREF = [
+    "AUDIO_QUALITY_LOW",
+    "AUDIO_QUALITY_MEDIUM",
+    "AUDIO_QUALITY_HIGH",
+]
+
+_QUALITY_RANK = {quality: i for i, quality in enumerate(QUALITY_PREF)}
+_AUDIO_QUALITY_RANK = {quality: i for i, quality in enumerate(AUDIO_QUALITY_PREF)}
+
+
+def _to_camel_case(string: str) -> str:
+    head, *tail = string.split("_")
+    return head + "".join(part.title() for part in tail)
+
+
+class Format:
+    # Values read from the player response, keyed by their snake case name.
+    _FIELDS = {
+        "itag": "itag",
+        "url": "url",
+        "signature_cipher": "signatureCipher",
+        "mime_type": "mimeType",
+        "bitrate": "bitrate",
+        "average_bitrate": "averageBitrate",
+        "width": "width",
+        "height": "height",
+        "fps": "fps",
+        "quality": "quality",
+        "quality_label": "qualityLabel",
+        "audio_quality": "audioQuality",
+        "audio_sample_rate": "audioSampleRate",
+        "audio_channels": "audioChannels",
+        "content_length": "contentLength",
+        "approx_duration_ms": "approxDurationMs",
+    }
+
+    __slots__ = (
+        *_FIELDS,
+        "type",
+        "ext",
+        "codec",
+        "decrypted_url",
+        "probe",
+        "sort_key",
+        "raw",
+    )
+
+    # Records are immutable, cache hits hand out the cached records themselves
+    # instead of copies. replace makes changed records.
+    def __init__(self, raw: dict, decrypted_url=None, probe=None) -> None:
+        values = {name: raw.get(key) for name, key in self._FIELDS.items()}
+        mime_info_search = _MIME_TYPE_RE.search(values["mime_type"] or "")
+        if mime_info_search is None:
+            values["type"] = values["ext"] = values["codec"] = None
+        else:
+            values["type"] = mime_info_search.group("type")
+            values["ext"] = mime_info_search.group("ext")
+            values["codec"] = mime_info_search.group("codec")
+        values["decrypted_url"] = decrypted_url
+        values["probe"] = probe
+        # A read only view, raw is part of the cached player response.
+        values["raw"] = MappingProxyType(raw)
+        values["sort_key"] = (
+            _QUALITY_RANK.get(values["quality"], -1),
+            values["fps"] if values["fps"] is not None else -1,
+            _AUDIO_QUALITY_RANK.get(values["audio_quality"], -1),
+            values["bitrate"] if values["bitrate"] is not None else -1,
+        )
+        self._set_values(values)
+
+    def _set_values(self, values):
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Format is immutable, use replace to change {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Format is immutable, cannot delete {name}")
+
+    @property
+    def mime_info(self):
+        return {"type": self.type, "ext": self.ext, "codec": self.codec}
+
+    @property
+    def is_video(self):
+        return self.type == "video"
+
+    @property
+    def is_audio(self):
+        return self.type == "audio"
+
+    @property
+    def reachable(self):
+        # Formats that were not probed are assumed to be reachable.
+        return (self.probe or {}).get("reachable", True)
+
+    def replace(self, **changes) -> "Format":
+        format = Format.__new__(Format)
+        format._set_values(
+            {name: changes.get(name, getattr(self, name)) for name in self.__slots__}
+        )
+        return format
+
+    # Dict style access, for code written against the old format dicts.
+    def __getitem__(self, key):
+        if key in self.__slots__ or key == "mime_info":
+            return getattr(self, key)
+        camel_key = _to_camel_case(key)
+        if camel_key in self.raw:
+            return self.raw[camel_key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self):
+        return {
+            **{name: getattr(self, name) for name in self.__slots__},
+            "raw": dict(self.raw),
+        }
+
+    def __setstate__(self, state):
+        self._set_values({**state, "raw": MappingProxyType(state["raw"])})
+
+    def __repr__(self) -> str:
+        return f"Format(itag={self.itag}, mime_type={self.mime_type!r}, quality={self.quality_label or self.audio_quality!r}, bitrate={self.bitrate})"
+
+
+def sort_formats(formats: Iterable[Format]) -> List[Format]:
+    return sorted(formats, key=lambda x: x.sort_key, reverse=True)
+
+
+def _codec_rank(format: Format, codecs: Sequence[str]):
+    for i, codec in enumerate(codecs):
+        if (format.codec or "").startswith(codec):
+            return i
+    return len(codecs)
+
+
+def select_format(
+    formats: Iterable[Format],
+    max_height: Optional[int] = None,
+    max_fps: Optional[int] = None,
+    max_bitrate: Optional[int] = None,
+    codecs: Sequence[str] = (),
+    ext: Optional[str] = None,
+    strict_codecs: bool = False,
+) -> Optional[Format]:
+    # Best format within the limits. codecs are codec prefixes in order of
+    # preference, they outrank quality unless nothing matches them.
+    candidates = [
+        x
+        for x in formats
+        if x.reachable
+        and (max_height is None or (x.height or 0) <= max_height)
+        and (max_fps is None or (x.fps or 0) <= max_fps)
+        and (max_bitrate is None or (x.bitrate or 0) <= max_bitrate)
+        and (ext is None or x.ext == ext)
+        and (not strict_codecs or _codec_rank(x, codecs) < len(codecs))
+    ]
+    if not candidates:
+        return None
+    return min(
+        candidates,
+        key=lambda x: (_codec_rank(x, codecs), tuple(-v for v in x.sort_key)),
+    )
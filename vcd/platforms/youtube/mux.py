@@ -0,0 +1,83 @@
+from typing import Sequence
+
+# Codec prefixes, as found in the mime types of the formats, that each output
+# container takes without re-encoding. FLV takes vp9 and av1 as enhanced FLV,
+# written by ffmpeg 6.1 and later, as the video was always copied into it.
+CONTAINER_CODECS = {
+    "flv": {"video": ("avc1", "vp9", "vp09", "av01"), "audio": ("mp4a",)},
+    "mp4": {"video": ("avc1", "vp9", "vp09", "av01"), "audio": ("mp4a", "opus")},
+    "mpegts": {"video": ("avc1",), "audio": ("mp4a", "opus")},
+}
+
+CONTAINER_ARGS = {
+    "flv": ["-f", "flv", "-flvflags", "no_duration_filesize"],
+    # Fragmented, so it can be written to a pipe and read while it is written.
+    "mp4": ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof"],
+    "mpegts": ["-f", "mpegts"],
+}
+
+DEFAULT_CONTAINERS = ("flv", "mp4", "mpegts")
+
+_ENCODER_ARGS = {
+    "video": ["libx264", "-preset", "veryfast"],
+    "audio": ["aac", "-b:a", "160k"],
+}
+
+# Rough cores used by a re-encode of one stream, a copy costs nothing. The
+# video cost is for 1080p at 30 fps and scales with the pixel rate.
+_TRANSCODE_CPU_COST = {"video": 1.5, "audio": 0.05}
+_REFERENCE_PIXEL_RATE = 1920 * 1080 * 30
+
+
+def video_cost_scale(format):
+    # Formats without dimensions are costed as the reference.
+    if not format.width or not format.height:
+        return 1.0
+    return format.width * format.height * (format.fps or 30) / _REFERENCE_PIXEL_RATE
+
+
+def can_copy(format, container):
+    return (format.codec or "").startswith(
+        CONTAINER_CODECS[container][format.type]
+    )
+
+
+class MuxPlan:
+    def __init__(self, container, copy_video, copy_audio, video_scale=1.0) -> None:
+        self.container = container
+        self.copy_video = copy_video
+        self.copy_audio = copy_audio
+        self.video_scale = video_scale
+
+    @property
+    def cpu_cost(self):
+        return (
+            0 if self.copy_video else _TRANSCODE_CPU_COST["video"] * self.video_scale
+        ) + (0 if self.copy_audio else _TRANSCODE_CPU_COST["audio"])
+
+    def ffmpeg_output_args(self):
+        return [
+            "-c:v",
+            *(["copy"] if self.copy_video else _ENCODER_ARGS["video"]),
+            "-c:a",
+            *(["copy"] if self.copy_audio else _ENCODER_ARGS["audio"]),
+            *CONTAINER_ARGS[self.container],
+        ]
+
+    def __repr__(self) -> str:
+        return f"MuxPlan(container={self.container}, video={'copy' if self.copy_video else 'encode'}, audio={'copy' if self.copy_audio else 'encode'}, cpu_cost={self.cpu_cost:.2f})"
+
+
+def plan_mux(video, audio, containers: Sequence[str] = DEFAULT_CONTAINERS) -> MuxPlan:
+    # Cheapest container for the pair, earlier containers win ties.
+    video_scale = video_cost_scale(video)
+    plans = [
+        MuxPlan(
+            container,
+            can_copy(video, container),
+            can_copy(audio, container),
+            video_scale,
+        )
+        for container in containers
+    ]
+    return min(plans, key=lambda x: x.cpu_cost)
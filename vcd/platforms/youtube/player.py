@@ -0,0 +1,263 @@
+from typing import Optional
+from collections import OrderedDict
+from vcd.utils.js import JsRuntime
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class YoutubePlayer:
+    def __init__(
+        self,
+        player_id,
+        sts: Optional[int] = None,
+        decrypt_n_func_name: Optional[str] = None,
+        decrypt_n_func_src: Optional[str] = None,
+        js_runtime: Optional[JsRuntime] = None,
+    ) -> None:
+        self.player_id = player_id
+        self.sts = sts
+        self.decrypt_n_func_name = decrypt_n_func_name
+        self.decrypt_n_func_src = decrypt_n_func_src
+        self._js_runtime = js_runtime
+
+    def __deepcopy__(self, memo):
+        # Players are shared between videos and never mutated once loaded.
+        return self
+
+    _SIS_RE = re.compile(r"(?:signatureTimestamp|sts)\s*:\s*(?P<sts>[0-9]{5})")
+
+    _JS_DECRYPT_FUNC_META_RE = re.compile(
+        r"""
+        (?:\(\s*(?P<b>[a-z])\s*=\s*(?:String\s*\.\s*fromCharCode\s*\(\s*110\s*\)|\"n+\"\[\s*\+?s*[\w$.]+\s*]
+        )\s*,(?P<c>[a-z])\s*=\s*[a-z]\s*)?
+        \.\s*get\s*\(\s*(?(b)(?P=b)|\"n{1,2}\")(?:\s*\)){2}\s*&&\s*\(\s*(?(c)(?P=c)|b)\s*=\s*(?P<var>[a-zA-Z_$][\w$]*)(?:\s*\[(?P<idx>\d+)\])?\s*\(\s*[\w$]+\s*\)
+        """,
+        re.VERBOSE,
+    )
+
+    @classmethod
+    def _extract_sts(cls, js_src):
+        sis_search = cls._SIS_RE.search(js_src)
+        if sis_search:
+            return int(sis_search.group("sts"))
+
+    @classmethod
+    def _extract_decrypt_n_func(cls, js_src):
+        js_decrypt_func_meta_search = cls._JS_DECRYPT_FUNC_META_RE.search(js_src)
+        if js_decrypt_func_meta_search is None:
+            return None, None
+
+        func_array_var = js_decrypt_func_meta_search.group("var")
+        idx = js_decrypt_func_meta_search.group("idx")
+        if func_array_var is None or idx is None:
+            return None, None
+        func_names_list_search = re.search(
+            rf"var {re.escape(func_array_var)}\s*=\s*\[(.+?)\]\s*[,;]",
+            js_src,
+        )
+        func_names_list = [
+            i.strip() for i in func_names_list_search.group(1).split(",")
+        ]
+        decrypt_func_name = func_names_list[int(idx)]
+        func_search = re.search(
+            rf"{re.escape(decrypt_func_name)}=function(?:.|\n)*?}};\n",
+            js_src,
+            re.MULTILINE,
+        )
+        return decrypt_func_name, func_search.group(0)
+
+    @classmethod
+    def from_js_src(cls, player_id, js_src: str) -> "YoutubePlayer":
+        decrypt_n_func_name, decrypt_n_func_src = cls._extract_decrypt_n_func(js_src)
+        return cls(
+            player_id,
+            sts=cls._extract_sts(js_src),
+            decrypt_n_func_name=decrypt_n_func_name,
+            decrypt_n_func_src=decrypt_n_func_src,
+        )
+
+    def to_dict(self):
+        return {
+            "player_id": self.player_id,
+            "sts": self.sts,
+            "decrypt_n_func_name": self.decrypt_n_func_name,
+            "decrypt_n_func_src": self.decrypt_n_func_src,
+        }
+
+    @classmethod
+    def from_dict(cls, player_dict) -> "YoutubePlayer":
+        return cls(
+            player_dict["player_id"],
+            sts=player_dict.get("sts"),
+            decrypt_n_func_name=player_dict.get("decrypt_n_func_name"),
+            decrypt_n_func_src=player_dict.get("decrypt_n_func_src"),
+        )
+
+    @property
+    def js_runtime(self) -> JsRuntime:
+        return self._js_runtime or JsRuntime.default()
+
+    def decrypt_n_many(self, n_values: list) -> list:
+        # One runtime round trip for all values, of one video or of a whole batch.
+        if self.decrypt_n_func_src is None:
+            if n_values:
+                logger.warn(
+                    f"No n function found in player {self.player_id}, {len(n_values)} n values are left undecrypted and their downloads may be throttled"
+                )
+            return list(n_values)
+        return self.js_runtime.call_many(
+            self.decrypt_n_func_src, self.decrypt_n_func_name, n_values
+        )
+
+    @property
+    def decrypt_n(self):
+        if self.decrypt_n_func_src is None:
+            return None
+        return lambda n: self.decrypt_n_many([n])[0]
+
+
+class YoutubePlayerStore:
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, max_size: int = 32, cache_dir: Optional[str] = None) -> None:
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self._players = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._load_tasks = {}
+        self._latest = None
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def default(cls) -> "YoutubePlayerStore":
+        # Process wide store used by every YoutubeVideoInfo without its own store.
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    @classmethod
+    def set_default(cls, store: "YoutubePlayerStore"):
+        with cls._default_lock:
+            cls._default = store
+
+    def __len__(self):
+        return len(self._players)
+
+    def _player_path(self, player_id):
+        return os.path.join(self.cache_dir, f"{player_id}.json")
+
+    def _read_player(self, player_id) -> Optional[YoutubePlayer]:
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._player_path(player_id), "r") as f:
+                return YoutubePlayer.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError):
+            logger.warn(f"Failed to read cached player {player_id}")
+            return None
+
+    def _write_player(self, player: YoutubePlayer):
+        if self.cache_dir is None:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(player.to_dict(), f)
+            os.replace(tmp_path, self._player_path(player.player_id))
+        except OSError:
+            logger.warn(f"Failed to cache player {player.player_id}")
+
+    def _get_from_memory(self, player_id) -> Optional[YoutubePlayer]:
+        with self._lock:
+            player = self._players.get(player_id)
+            if player is not None:
+                self._players.move_to_end(player_id)
+            return player
+
+    def _put_in_memory(self, player: YoutubePlayer):
+        with self._lock:
+            self._players[player.player_id] = player
+            self._players.move_to_end(player.player_id)
+            while len(self._players) > self.max_size:
+                self._players.popitem(last=False)
+
+    def get(self, player_id) -> Optional[YoutubePlayer]:
+        player = self._get_from_memory(player_id)
+        if player is None:
+            player = self._read_player(player_id)
+            if player is not None:
+                self._put_in_memory(player)
+        return player
+
+    def put(self, player: YoutubePlayer):
+        self._put_in_memory(player)
+        self._write_player(player)
+
+    def clear(self):
+        with self._lock:
+            self._players.clear()
+            self._latest = None
+
+    def mark_latest(self, player_id):
+        # Called with players found on a watch page, i.e. the current version.
+        with self._lock:
+            self._latest = (player_id, time.time())
+
+    def latest(self, max_age: Optional[float] = None) -> Optional[YoutubePlayer]:
+        with self._lock:
+            latest = self._latest
+        if latest is None:
+            return None
+        player_id, seen_at = latest
+        if max_age is not None and time.time() - seen_at > max_age:
+            return None
+        return self.get(player_id)
+
+    def get_or_load(self, player_id, load) -> Optional[YoutubePlayer]:
+        player = self.get(player_id)
+        if player is not None:
+            return player
+        with self._lock:
+            load_lock = self._load_locks.setdefault(player_id, threading.Lock())
+        # Only one thread loads a given player, the others wait and reuse it.
+        with load_lock:
+            player = self.get(player_id)
+            if player is None:
+                player = load()
+                if player is not None:
+                    self.put(player)
+        with self._lock:
+            self._load_locks.pop(player_id, None)
+        return player
+
+    async def get_or_load_async(self, player_id, load) -> Optional[YoutubePlayer]:
+        player = self.get(player_id)
+        if player is not None:
+            return player
+        task = self._load_tasks.get(player_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load_and_put_async(load))
+            self._load_tasks[player_id] = task
+            task.add_done_callback(lambda _: self._load_tasks.pop(player_id, None))
+        return await asyncio.shield(task)
+
+    async def _load_and_put_async(self, load) -> Optional[YoutubePlayer]:
+        player = await load()
+        if player is not None:
+            self.put(player)
+        return player
@@ -1,15 +1,95 @@
 from vcd.utils.http import HttpClient
+from vcd.utils.stateful import Stateful
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Union
+import io
+import logging
+import tempfile
+import threading
 import time
 import random
 import re
 from hashlib import sha1
 
+logger = logging.getLogger(__name__)
+
+# Chunks other than the last have to be multiples of this, the start response
+# tells the actual granularity.
+UPLOAD_CHUNK_GRANULARITY = 256 * 1024
+
+
+class UploadFailedException(Exception):
+    pass
+
+
+class _InputReader:
+    # read(size) over the input of an upload, a file like object, bytes or an
+    # iterable of bytes.
+    def __init__(self, input_stream) -> None:
+        if isinstance(input_stream, (bytes, bytearray, memoryview)):
+            input_stream = io.BytesIO(input_stream)
+        self._read = getattr(input_stream, "read", None)
+        self._pieces = iter(input_stream) if self._read is None else None
+        self._pending = memoryview(b"")
+
+    def read(self, size) -> bytes:
+        if self._read is not None:
+            return self._read(size)
+        while not self._pending:
+            piece = next(self._pieces, None)
+            if piece is None:
+                return b""
+            self._pending = memoryview(piece)
+        data = self._pending[:size]
+        self._pending = self._pending[size:]
+        return data
+
+
+class _SpoolSlice:
+    # Request body reading length bytes of the spool from where it is. It has
+    # no fileno, so requests does not roll an in memory spool over to disk.
+    def __init__(self, spool, length, block_size=64 * 1024) -> None:
+        self._spool = spool
+        self._remaining = length
+        self._block_size = block_size
+
+    def __len__(self):
+        return self._remaining
+
+    def read(self, size=-1) -> bytes:
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._spool.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def __iter__(self):
+        return iter(lambda: self.read(self._block_size), b"")
+
 
 class YoutubeVideoUploader:
-    def __init__(self, cookies: dict, http_client: HttpClient) -> None:
+    _UPLOAD_START_URL = "https://upload.youtube.com/upload/studio?authuser=3"
+
+    def __init__(
+        self,
+        cookies: dict,
+        http_client: HttpClient,
+        chunk_size=16 * 1024 * 1024,
+        max_resume_attempts=5,
+        spool_memory_size=4 * 1024 * 1024,
+    ) -> None:
         self.cookies = cookies
         self._http_client = http_client
-        self._info = self.get_info()
+        self._chunk_size = chunk_size
+        self._max_resume_attempts = max_resume_attempts
+        # The chunk that is not acknowledged yet is kept in memory up to this
+        # size and on disk beyond it.
+        self._spool_memory_size = spool_memory_size
+        # The studio page is fetched in the background, the first use of _info
+        # waits for it.
+        executor = ThreadPoolExecutor(max_workers=1)
+        self._info_future = executor.submit(self.get_info)
+        executor.shutdown(wait=False)
         # self.auth = f"SAPISIDHASH {self.generate_sapisidhash(int(time.time() * 1000), self.cookies['SAPISID'])}",
 
     @staticmethod
@@ -35,9 +115,9 @@ class YoutubeVideoUploader:
     def generate_sapisidhash(ts_ms, sapisid):
         return f"{ts_ms}_{sha1(f'{ts_ms} {sapisid} https://studio.youtube.com'.encode()).hexdigest()}"
 
-    def _get_upload_url(self):
+    def _start_upload(self):
         res = self._http_client.post(
-            "https://upload.youtube.com/upload/studio?authuser=3",
+            self._UPLOAD_START_URL,
             cookies=self.cookies,
             headers={
                 # "authorization": self.auth,
@@ -49,7 +129,17 @@ class YoutubeVideoUploader:
             },
             json={"frontendUploadId": f"innertube_studio:{self.generate_hash()}:0"},
         )
-        return res.headers["X-Goog-Upload-URL"]
+        granularity = res.headers.get("X-Goog-Upload-Chunk-Granularity", "")
+        return res.headers["X-Goog-Upload-URL"], (
+            int(granularity) if granularity.isdigit() else UPLOAD_CHUNK_GRANULARITY
+        )
+
+    def _get_upload_url(self):
+        return self._start_upload()[0]
+
+    @property
+    def _info(self):
+        return self._info_future.result()
 
     def get_info(self):
         res = self._http_client.get(
@@ -67,21 +157,122 @@ class YoutubeVideoUploader:
             "delegate_context": delegate_context,
         }
 
-    def upload(self, input_stream, scotty_resource_id_stateful):
-        upload_url = self._get_upload_url()
+    def _query_upload(self, upload_url):
+        # Where the server is at, after a chunk failed.
         res = self._http_client.post(
             upload_url,
             headers={
-                "content-type": "application/x-www-form-urlencoded;charset=utf-8",
-                "x-goog-upload-command": "upload, finalize",
-                "x-goog-upload-file-name": "file-" + str(int(time.time() * 1000)),
-                "x-goog-upload-offset": "0",
+                "x-goog-upload-command": "query",
                 "referrer": "https://studio.youtube.com/",
             },
             cookies=self.cookies,
-            data=input_stream,
         )
-        scotty_resource_id_stateful.set(res.json()["scottyResourceId"])
+        received = res.headers.get("X-Goog-Upload-Size-Received", "")
+        return (
+            res.headers.get("X-Goog-Upload-Status"),
+            int(received) if received.isdigit() else None,
+            res,
+        )
+
+    def _send_chunk(self, upload_url, spool, offset, size, finalize):
+        # Sends the spooled size bytes at offset, and after a failure only what
+        # the server did not commit. The json of the final response is returned
+        # for the last chunk.
+        committed = offset
+        failures = 0
+        while True:
+            spool.seek(committed - offset)
+            try:
+                res = self._http_client.post(
+                    upload_url,
+                    headers={
+                        "content-type": "application/x-www-form-urlencoded;charset=utf-8",
+                        "x-goog-upload-command": (
+                            "upload, finalize" if finalize else "upload"
+                        ),
+                        "x-goog-upload-offset": str(committed),
+                        "referrer": "https://studio.youtube.com/",
+                    },
+                    cookies=self.cookies,
+                    data=_SpoolSlice(spool, offset + size - committed) if size else b"",
+                    # The body is resent from the spool below, not by the client.
+                    retry=1,
+                )
+                return res.json() if finalize else None
+            except Exception as e:
+                failures += 1
+                if failures > self._max_resume_attempts:
+                    raise
+                logger.warn(
+                    f"Upload chunk at {committed} failed, resuming... {failures}/{self._max_resume_attempts}: {e}"
+                )
+                time.sleep(min(2 ** (failures - 1), 30))
+                status, received, res = self._query_upload(upload_url)
+                if status == "final" and finalize:
+                    return res.json()
+                if status != "active" or received is None:
+                    raise UploadFailedException(
+                        f"Upload cannot be resumed, status: {status}"
+                    )
+                if not offset <= received <= offset + size:
+                    raise UploadFailedException(
+                        f"Server has {received} bytes, spooled are {offset}-{offset + size}"
+                    )
+                committed = received
+
+    def upload(
+        self,
+        input_stream,
+        scotty_resource_id_stateful: Optional[Stateful] = None,
+        upload_start: Optional[Union[tuple, Future]] = None,
+    ):
+        # Sends the stream in chunks of the resumable protocol. Only the chunk
+        # in flight is spooled, a failed chunk is resumed from the offset the
+        # server reports. The resource id is also published through the
+        # stateful, a failure is published too so that nobody waits forever.
+        # upload_start is a result of _start_upload, or a future of one, made
+        # ahead of time.
+        try:
+            if upload_start is None:
+                upload_start = self._start_upload()
+            elif isinstance(upload_start, Future):
+                upload_start = upload_start.result()
+            upload_url, granularity = upload_start
+            chunk_size = max(
+                granularity, self._chunk_size - self._chunk_size % granularity
+            )
+            reader = _InputReader(input_stream)
+            offset = 0
+            with tempfile.SpooledTemporaryFile(
+                max_size=self._spool_memory_size
+            ) as spool:
+                while True:
+                    spool.seek(0)
+                    spool.truncate()
+                    size = 0
+                    while size < chunk_size:
+                        data = reader.read(chunk_size - size)
+                        if not data:
+                            break
+                        spool.write(data)
+                        size += len(data)
+                    # A full chunk may be the last one, then an empty chunk
+                    # finalizes the upload.
+                    finalize = size < chunk_size
+                    result = self._send_chunk(upload_url, spool, offset, size, finalize)
+                    offset += size
+                    logger.debug(f"Uploaded {offset} bytes")
+                    if finalize:
+                        break
+            scotty_resource_id = result["scottyResourceId"]
+        except Exception as e:
+            if scotty_resource_id_stateful is not None:
+                scotty_resource_id_stateful.set_exception(e)
+            raise
+        logger.info(f"Uploaded {offset} bytes as {scotty_resource_id}")
+        if scotty_resource_id_stateful is not None:
+            scotty_resource_id_stateful.set(scotty_resource_id)
+        return scotty_resource_id
 
     def get_challenge_info(self):
         body = {
@@ -131,9 +322,11 @@ class YoutubeVideoUploader:
         scotty_resource_id,
         is_draft=False,
         is_short=False,
+        challenge=None,
     ):
         channel_id = self._info["channel_id"]
-        challenge = self.get_challenge_info()["challenge"]
+        if challenge is None:
+            challenge = self.get_challenge_info()["challenge"]
 
         body = {
             "channelId": channel_id,
@@ -199,3 +392,101 @@ class YoutubeVideoUploader:
             json=body,
         )
         return res
+
+
+class YoutubeUploadSession:
+    # One upload with its handshakes off the critical path. The upload start
+    # and the attestation challenge, after the studio info, are requested when
+    # the session is created, and the video is created by a worker the moment
+    # the resource id is published, not after upload returns to the caller.
+    def __init__(
+        self,
+        uploader: YoutubeVideoUploader,
+        title,
+        description,
+        privacy,
+        is_draft=False,
+        is_short=False,
+        challenge_max_age: Optional[float] = 600,
+    ) -> None:
+        self._uploader = uploader
+        self._meta = {
+            "title": title,
+            "description": description,
+            "privacy": privacy,
+            "is_draft": is_draft,
+            "is_short": is_short,
+        }
+        # How long a challenge is assumed to stay valid. It is refetched in the
+        # background while the bytes are still being sent.
+        self._challenge_max_age = challenge_max_age
+        self.metrics = {}
+        self._executor = ThreadPoolExecutor(max_workers=3)
+        self._done = threading.Event()
+        self._upload_start = self._executor.submit(uploader._start_upload)
+        self._challenge = self._fetch_challenge()
+        if challenge_max_age:
+            threading.Thread(target=self._refresh_challenge, daemon=True).start()
+
+    def _fetch_challenge(self):
+        return self._executor.submit(
+            lambda: (time.monotonic(), self._uploader.get_challenge_info()["challenge"])
+        )
+
+    def _refresh_challenge(self):
+        while not self._done.wait(self._challenge_max_age / 2):
+            try:
+                self._challenge = self._fetch_challenge()
+            except RuntimeError:
+                # Closed while waking up.
+                return
+
+    def _current_challenge(self):
+        try:
+            fetched_at, challenge = self._challenge.result()
+        except Exception as e:
+            logger.warn(f"Prefetched upload challenge failed, fetching again: {e}")
+            return None
+        if (
+            self._challenge_max_age
+            and time.monotonic() - fetched_at > self._challenge_max_age
+        ):
+            return None
+        return challenge
+
+    def _create_video(self, scotty_resource_id_stateful: Stateful):
+        scotty_resource_id = scotty_resource_id_stateful.get(block=True)
+        received_at = time.monotonic()
+        res = self._uploader.upload_video_meta(
+            scotty_resource_id=scotty_resource_id,
+            challenge=self._current_challenge(),
+            **self._meta,
+        )
+        self.metrics["create_video_seconds"] = time.monotonic() - received_at
+        return res
+
+    def upload(self, input_stream):
+        # Returns the response of the createvideo call.
+        started_at = time.monotonic()
+        scotty_resource_id_stateful = Stateful()
+        create_video = self._executor.submit(
+            self._create_video, scotty_resource_id_stateful
+        )
+        try:
+            self._uploader.upload(
+                input_stream, scotty_resource_id_stateful, self._upload_start
+            )
+            self.metrics["upload_seconds"] = time.monotonic() - started_at
+            return create_video.result()
+        finally:
+            self.close()
+
+    def close(self):
+        self._done.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,53 @@
+import json
+import re
+
+_ANCHOR_RE = re.compile(
+    r"(?P<player_response>ytInitialPlayerResponse\s*=\s*)(?=\{)"
+    r"|(?P<yt_cfg>ytcfg\.set\s*\(\s*)(?=\{)"
+    r"|\"(?:PLAYER_JS_URL|jsUrl)\"\s*:\s*\"(?P<player_js_url>[^\"]+)\""
+    r"|(?is:<meta(?=[^>]+(?:itemprop|name|property|id|http-equiv)=([\"\']?)(?:og:title|twitter:title|title)\4)[^>]+?content=([\"\'])(?P<title>.*?)\5)"
+)
+
+# The anchors that are not JSON objects, searched for again inside the objects
+# the scan skips. The old per-field regexes found them anywhere in the page.
+_NESTED_RES = {
+    "player_js_url": re.compile(r"\"(?:PLAYER_JS_URL|jsUrl)\"\s*:\s*\"(?P<player_js_url>[^\"]+)\""),
+    "title": re.compile(
+        r"(?is)<meta(?=[^>]+(?:itemprop|name|property|id|http-equiv)=([\"\']?)(?:og:title|twitter:title|title)\1)[^>]+?content=([\"\'])(?P<title>.*?)\2"
+    ),
+}
+
+_JSON_DECODER = json.JSONDecoder()
+
+_FIELDS = ("player_response", "yt_cfg", "player_js_url", "title")
+
+
+def extract_watch_page(src: str) -> dict:
+    # Finds the first occurrence of every field in one forward scan. The JSON
+    # objects are cut by the json decoder itself, which stops at the matching
+    # closing brace, and the scan resumes after them.
+    page = dict.fromkeys(_FIELDS)
+    pos = 0
+    while any(page[field] is None for field in _FIELDS):
+        match = _ANCHOR_RE.search(src, pos)
+        if match is None:
+            break
+        pos = match.end()
+        kind = match.lastgroup
+        if kind in ("player_response", "yt_cfg"):
+            try:
+                obj, pos = _JSON_DECODER.raw_decode(src, match.end())
+            except json.JSONDecodeError:
+                continue
+            if page[kind] is None:
+                page[kind] = obj
+            # The scan skipped the object, so pick up the anchors inside it,
+            # at any depth. They come before anything found after the object.
+            for field, regex in _NESTED_RES.items():
+                if page[field] is None:
+                    nested = regex.search(src, match.end(), pos)
+                    if nested:
+                        page[field] = nested.group(field)
+        elif page[kind] is None:
+            page[kind] = match.group(kind)
+    return page
@@ -0,0 +1,147 @@
+import aiohttp
+import asyncio
+import logging
+import time
+import traceback
+import urllib
+from typing import Optional
+from vcd.utils.http import RequestFailedException
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHttpClient:
+    def __init__(
+        self,
+        headers,
+        proxies,
+        retry: int = 3,
+        limit: int = 100,
+        limit_per_host: int = 10,
+    ) -> None:
+        self.headers = headers or {}
+        self.proxies = proxies or {}
+        self.retry = retry
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # The session binds to the running loop, so it is created on first use.
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit, limit_per_host=self.limit_per_host
+                ),
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def _get_updated_headers(self, headers=None):
+        headers = headers or {}
+        headers.update(self.headers)
+        return headers
+
+    def _get_proxy(self, url):
+        return self.proxies.get(urllib.parse.urlparse(url).scheme)
+
+    async def _retry(self, func, *args, retry: Optional[int] = None, **kwargs):
+        # retry overrides the attempts of the client for one call, as in
+        # HttpClient.
+        retry = self.retry if retry is None else retry
+        for i in range(retry):
+            try:
+                return await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warn(
+                    f"Failed to execute {func.__name__}, retrying... {i + 1}/{retry}, traceback: {traceback.format_exc()}"
+                )
+        raise RequestFailedException(f"Failed to execute {func.__name__}")
+
+    async def _request(self, method, url, accepted_status={200}, stream=False, **kwargs):
+        res = await self._get_session().request(
+            method, url, proxy=self._get_proxy(url), **kwargs
+        )
+        if res.status not in accepted_status:
+            res.release()
+            logger.warn(f"Failed to {method.lower()} {url}, status code: {res.status}")
+            raise RequestFailedException(
+                f"Failed to {method.lower()} {url}, status code: {res.status} is not in {accepted_status}"
+            )
+        if not stream:
+            # Read the body inside the retry loop so a broken body is retried too.
+            await res.read()
+        return res
+
+    async def _get(self, url, accepted_status={200}, **kwargs):
+        return await self._request("GET", url, accepted_status=accepted_status, **kwargs)
+
+    async def get(
+        self, url, accepted_status={200}, retry: Optional[int] = None, **kwargs
+    ) -> aiohttp.ClientResponse:
+        headers = self._get_updated_headers(kwargs.get("headers", {}))
+        kwargs["headers"] = headers
+
+        res = await self._retry(
+            self._get, url=url, accepted_status=accepted_status, retry=retry, **kwargs
+        )
+
+        return res
+
+    async def _post(self, url, accepted_status={200}, **kwargs):
+        return await self._request(
+            "POST", url, accepted_status=accepted_status, **kwargs
+        )
+
+    async def post(
+        self, url, accepted_status={200}, retry: Optional[int] = None, **kwargs
+    ) -> aiohttp.ClientResponse:
+        headers = self._get_updated_headers(kwargs.get("headers", {}))
+        kwargs["headers"] = headers
+
+        res = await self._retry(
+            self._post, url=url, accepted_status=accepted_status, retry=retry, **kwargs
+        )
+
+        return res
+
+    async def probe(self, url, method="range", timeout=10, **kwargs):
+        headers = self._get_updated_headers(kwargs.pop("headers", {}))
+        start = time.perf_counter()
+        if method != "head":
+            headers["Range"] = "bytes=0-0"
+        try:
+            async with self._get_session().request(
+                "HEAD" if method == "head" else "GET",
+                url,
+                headers=headers,
+                proxy=self._get_proxy(url),
+                timeout=aiohttp.ClientTimeout(total=timeout),
+                **kwargs,
+            ) as res:
+                status = res.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warn(f"Failed to probe {url}: {e}")
+            return {
+                "reachable": False,
+                "status": None,
+                "latency": time.perf_counter() - start,
+            }
+        return {
+            "reachable": status in {200, 206},
+            "status": status,
+            "latency": time.perf_counter() - start,
+        }
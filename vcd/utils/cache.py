@@ -1,57 +1,462 @@
+from collections import OrderedDict
+from typing import Optional
+from vcd.utils.frozen import freeze
 import logging
 import copy
+import functools
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import types
 
 logger = logging.getLogger(__name__)
 
+_local = threading.local()
+
+_ATOMIC_TYPES = (str, bytes, bytearray, int, float, bool, type(None))
+_OPAQUE_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.MethodType,
+    types.BuiltinFunctionType,
+)
+
+
+def _deep_sizeof(obj, seen):
+    # Objects already in seen are not counted again.
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, _ATOMIC_TYPES) or isinstance(obj, _OPAQUE_TYPES):
+        return size
+    if isinstance(obj, (dict, types.MappingProxyType)):
+        size += sum(
+            _deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(v, seen) for v in obj)
+    if hasattr(obj, "__dict__"):
+        size += _deep_sizeof(vars(obj), seen)
+    for slot in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, slot):
+            size += _deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+
+class _CacheFrame:
+    __slots__ = ("cacheable", "expires_at", "rolled_back", "dependencies")
+
+    def __init__(self, cacheable) -> None:
+        self.cacheable = cacheable
+        self.expires_at = None
+        self.rolled_back = False
+        self.dependencies = set()
+
+    def inherit_expiry(self, expires_at):
+        if expires_at is not None and (
+            self.expires_at is None or expires_at < self.expires_at
+        ):
+            self.expires_at = expires_at
+
+
+class _CacheFlight:
+    # One running computation of a cache key, other threads wait on it.
+    __slots__ = ("owner", "event", "result", "exception", "expires_at")
+
+    def __init__(self) -> None:
+        self.owner = threading.get_ident()
+        self.event = threading.Event()
+        self.result = None
+        self.exception = None
+        self.expires_at = None
+
+
+def _cache_frames():
+    # Cached computations running on this thread, innermost last.
+    frames = getattr(_local, "frames", None)
+    if frames is None:
+        frames = _local.frames = []
+    return frames
+
+
+class CacheBackend:
+    # Storage shared by Cacheable instances, possibly across processes. Values
+    # are stored per namespace and key together with their expiry timestamp.
+
+    def get(self, namespace, key):
+        raise NotImplementedError()
+
+    def set(self, namespace, key, value, expires_at=None):
+        raise NotImplementedError()
+
+    def delete(self, namespace, key):
+        raise NotImplementedError()
+
+    def clear(self, namespace):
+        raise NotImplementedError()
+
+
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self) -> None:
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None and entry[1] is not None and entry[1] <= time.time():
+                del self._entries[(namespace, key)]
+                return None
+            return entry
+
+    def set(self, namespace, key, value, expires_at=None):
+        with self._lock:
+            self._entries[(namespace, key)] = (value, expires_at)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+
+    def clear(self, namespace):
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == namespace]:
+                del self._entries[entry_key]
+
+
+class SqliteCacheBackend(CacheBackend):
+    # Values are pickled into one sqlite table, sqlite's file locking makes it
+    # safe to share between processes.
+
+    def __init__(self, db="cache.db", table="vcd_cache", timeout=30) -> None:
+        self.db = db
+        self.table = table
+        self.timeout = timeout
+        self._init_table()
+
+    def _sql(self, sql, parameters=()):
+        with sqlite3.connect(self.db, timeout=self.timeout) as conn:
+            c = conn.cursor()
+            res = c.execute(sql, parameters).fetchall()
+            conn.commit()
+        return res
+
+    def _init_table(self):
+        self._sql("PRAGMA journal_mode=WAL")
+        self._sql(
+            f"CREATE TABLE IF NOT EXISTS {self.table} (namespace TEXT, key TEXT, value BLOB, expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+
+    def get(self, namespace, key):
+        rows = self._sql(
+            f"SELECT value, expires_at FROM {self.table} WHERE namespace = ? AND key = ?",
+            (namespace, repr(key)),
+        )
+        if not rows:
+            return None
+        value, expires_at = rows[0]
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(namespace, key)
+            return None
+        try:
+            return pickle.loads(value), expires_at
+        except Exception:
+            logger.warn(f"Failed to load cached value for {namespace} {key}")
+            self.delete(namespace, key)
+            return None
+
+    def set(self, namespace, key, value, expires_at=None):
+        try:
+            value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            logger.warn(f"Failed to serialize cached value for {namespace} {key}")
+            return
+        self._sql(
+            f"INSERT OR REPLACE INTO {self.table} (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, repr(key), value, expires_at),
+        )
+
+    def delete(self, namespace, key):
+        self._sql(
+            f"DELETE FROM {self.table} WHERE namespace = ? AND key = ?",
+            (namespace, repr(key)),
+        )
+
+    def clear(self, namespace):
+        self._sql(f"DELETE FROM {self.table} WHERE namespace = ?", (namespace,))
+
+    def purge_expired(self):
+        self._sql(
+            f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (time.time(),),
+        )
+
 
 class Cacheable:
 
     @staticmethod
-    def cache(method):
-        cache_key = method.__name__
+    def cache(method=None, *, ttl=None, shared=False, depends_on=()):
+        # Use as @Cacheable.cache or @Cacheable.cache(ttl=..., shared=...). ttl is
+        # either a number of seconds or a callable returning the seconds for a
+        # result, None meaning no expiry. A cached value never outlives the cached
+        # values it was computed from. Shared values are also read from and
+        # written to the instance's cache backend.
+        # The cached values read while computing a value are recorded as its
+        # dependencies for invalidate_cache. depends_on declares extra ones, which
+        # values loaded from the backend need as nothing was recorded for them.
+        if method is None:
+            return lambda method: Cacheable.cache(
+                method, ttl=ttl, shared=shared, depends_on=depends_on
+            )
+        method_name = method.__name__
 
+        @functools.wraps(method)
         def method_wrapper(self, *args, **kwargs):
             if not isinstance(self, Cacheable):
                 raise TypeError(
                     f"The class {self.__class__.__name__} must inherit from Cachable to use the cache decorator."
                 )
-            if cache_key in self._cache and self._allow_cache:
-                logger.debug(f"Cache hit for {cache_key}")
-                return copy.deepcopy(self.get_cache(cache_key))
-            self._rollback_flag = False
-            res = None
+            cache_key = Cacheable._cache_key(method_name, args, kwargs)
+            frames = _cache_frames()
+            if cache_key is None or not self._allow_cache:
+                return self._compute(method, ttl, frames, args, kwargs, cache_key)
+            while True:
+                with self._cache_lock:
+                    entry = self._get_cache_entry(cache_key)
+                    if entry is None:
+                        flight = self._cache_flights.get(cache_key)
+                        if flight is None:
+                            flight = self._cache_flights[cache_key] = _CacheFlight()
+                            break
+                if entry is not None:
+                    logger.debug(f"Cache hit for {cache_key}")
+                    return self._cache_result(frames, cache_key, entry[0], entry[1])
+                if flight.owner == threading.get_ident():
+                    # Reentrant call from the thread computing this key.
+                    return self._compute(method, ttl, frames, args, kwargs, cache_key)
+                flight.event.wait()
+                if flight.exception is not None:
+                    raise flight.exception
+                return self._cache_result(
+                    frames, cache_key, flight.result, flight.expires_at
+                )
             try:
-                res = method(self, *args, **kwargs)
+                if shared:
+                    entry = self._get_shared_cache_entry(cache_key)
+                    if entry is not None:
+                        with self._cache_lock:
+                            self._add_cache_dependencies(cache_key, depends_on)
+                        flight.result, flight.expires_at = entry
+                        return self._cache_result(frames, cache_key, entry[0], entry[1])
+                res, frame = self._compute(
+                    method, ttl, frames, args, kwargs, cache_key, return_frame=True
+                )
+                if not frame.rolled_back:
+                    with self._cache_lock:
+                        res = self._set_cache_entry(cache_key, res, frame.expires_at)
+                        self._add_cache_dependencies(cache_key, frame.dependencies)
+                        self._add_cache_dependencies(cache_key, depends_on)
+                    if shared:
+                        self._set_shared_cache_entry(cache_key, res, frame.expires_at)
+                flight.result = res
+                flight.expires_at = frame.expires_at
+                return res
             except Exception as e:
-                if self._rollback_on_fail:
-                    self.rollback_cache()
+                flight.exception = e
                 raise e
-            if res is None and self._rollback_on_fail:
-                self.rollback_cache()
-            if self._allow_cache and not self._rollback_flag:
-                self.update_cache(cache_key, res)
-            return res
+            finally:
+                with self._cache_lock:
+                    self._cache_flights.pop(cache_key, None)
+                flight.event.set()
 
         return method_wrapper
 
-    def __init__(self, allow_cache=True, rollback_on_fail=True):
+    def _cache_result(self, frames, cache_key, value, expires_at):
+        if frames:
+            frames[-1].inherit_expiry(expires_at)
+            if frames[-1].cacheable is self:
+                frames[-1].dependencies.add(cache_key)
+        if self._read_only_cache:
+            return value
+        return copy.deepcopy(value)
+
+    def _compute(
+        self, method, ttl, frames, args, kwargs, cache_key=None, return_frame=False
+    ):
+        frame = _CacheFrame(self)
+        frames.append(frame)
+        try:
+            res = method(self, *args, **kwargs)
+        except Exception as e:
+            if self._rollback_on_fail:
+                frame.rolled_back = True
+            raise e
+        finally:
+            frames.pop()
+        if res is None and self._rollback_on_fail:
+            frame.rolled_back = True
+        frame.inherit_expiry(Cacheable._expires_at(ttl, res))
+        if frames:
+            frames[-1].inherit_expiry(frame.expires_at)
+            if frames[-1].cacheable is self:
+                if cache_key is None:
+                    frames[-1].dependencies.update(frame.dependencies)
+                else:
+                    frames[-1].dependencies.add(cache_key)
+        if return_frame:
+            return res, frame
+        return res
+
+    @staticmethod
+    def _cache_key(method_name, args, kwargs):
+        if not args and not kwargs:
+            return method_name
+        cache_key = (method_name, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(cache_key)
+        except TypeError:
+            # Unhashable arguments are computed every time.
+            return None
+        return cache_key
+
+    @staticmethod
+    def _expires_at(ttl, res):
+        if callable(ttl):
+            ttl = ttl(res)
+        if ttl is None:
+            return None
+        return time.time() + ttl
+
+    def __init__(
+        self,
+        allow_cache=True,
+        rollback_on_fail=True,
+        max_cache_entries=None,
+        read_only_cache=False,
+        cache_backend: Optional[CacheBackend] = None,
+        cache_namespace=None,
+    ):
+        # With read_only_cache, values are frozen once when stored and hits return
+        # them as is instead of a deep copy.
         self._allow_cache = allow_cache
-        self._cache = {}
-        self._rollback_flag = False
+        self._cache = OrderedDict()
+        self._cache_lock = threading.RLock()
+        self._cache_flights = {}
+        self._cache_dependents = {}
         self._rollback_on_fail = rollback_on_fail
+        self._max_cache_entries = max_cache_entries
+        self._read_only_cache = read_only_cache
+        self._cache_backend = cache_backend
+        self._cache_namespace = cache_namespace or self.__class__.__name__
+
+    def _get_shared_cache_entry(self, key):
+        if self._cache_backend is None:
+            return None
+        try:
+            entry = self._cache_backend.get(self._cache_namespace, key)
+        except Exception:
+            logger.warn(f"Failed to read {key} from cache backend")
+            return None
+        if entry is None:
+            return None
+        logger.debug(f"Shared cache hit for {key}")
+        with self._cache_lock:
+            value = self._set_cache_entry(key, entry[0], entry[1])
+        return value, entry[1]
+
+    def _set_shared_cache_entry(self, key, value, expires_at):
+        if self._cache_backend is None:
+            return
+        try:
+            self._cache_backend.set(self._cache_namespace, key, value, expires_at)
+        except Exception:
+            logger.warn(f"Failed to write {key} to cache backend")
+
+    def _get_cache_entry(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            logger.debug(f"Cache expired for {key}")
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def _set_cache_entry(self, key, value, expires_at=None):
+        if self._read_only_cache:
+            value = freeze(value)
+        self._cache[key] = (value, expires_at)
+        self._cache.move_to_end(key)
+        if self._max_cache_entries is not None:
+            while len(self._cache) > self._max_cache_entries:
+                self._cache.popitem(last=False)
+        return value
 
     def get_cache(self, key):
-        return self._cache.get(key)
+        with self._cache_lock:
+            entry = self._get_cache_entry(key)
+        if entry is None:
+            entry = self._get_shared_cache_entry(key)
+        return entry[0] if entry is not None else None
+
+    def _add_cache_dependencies(self, key, dependencies):
+        for dependency in dependencies:
+            if dependency != key:
+                self._cache_dependents.setdefault(dependency, set()).add(key)
 
-    def update_cache(self, key, value):
-        self._cache[key] = value
+    def update_cache(self, key, value, ttl=None, shared=False, depends_on=()):
+        expires_at = Cacheable._expires_at(ttl, value)
+        with self._cache_lock:
+            value = self._set_cache_entry(key, value, expires_at)
+            self._add_cache_dependencies(key, depends_on)
+        if shared:
+            self._set_shared_cache_entry(key, value, expires_at)
 
     def delete_cache(self, key):
-        if key in self._cache:
-            del self._cache[key]
+        with self._cache_lock:
+            self._cache.pop(key, None)
 
     def rollback_cache(self):
-        self._rollback_flag = True
+        # Keeps the result of the cached call running on this thread out of the cache.
+        frames = _cache_frames()
+        if frames:
+            frames[-1].rolled_back = True
+
+    def invalidate_cache(self, *keys):
+        # Drops the keys and everything computed from them, here and in the
+        # cache backend, and keeps the rest of the cache.
+        with self._cache_lock:
+            invalidated = set()
+            pending = list(keys)
+            while pending:
+                key = pending.pop()
+                if key in invalidated:
+                    continue
+                invalidated.add(key)
+                self._cache.pop(key, None)
+                pending.extend(self._cache_dependents.pop(key, ()))
+        if self._cache_backend is not None:
+            for key in invalidated:
+                try:
+                    self._cache_backend.delete(self._cache_namespace, key)
+                except Exception:
+                    logger.warn(f"Failed to delete {key} from cache backend")
+        logger.debug(f"Invalidated cache keys: {invalidated}")
+        return invalidated
+
+    def cache_footprint(self, exclude=()):
+        # Approximate bytes held by each cached value. Objects shared between
+        # values are counted once, for the first key that holds them.
+        with self._cache_lock:
+            entries = [(k, v[0]) for k, v in self._cache.items() if k not in exclude]
+        seen = set()
+        return {key: _deep_sizeof(value, seen) for key, value in entries}
 
     def clear_cache(self):
-        self._cache = {}
+        with self._cache_lock:
+            self._cache = OrderedDict()
+            self._cache_dependents = {}
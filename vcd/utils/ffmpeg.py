@@ -0,0 +1,222 @@
+from collections import deque
+from typing import Callable, Optional
+import logging
+import os
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class FFmpegFailedException(Exception):
+    pass
+
+
+class FFmpegStalledException(FFmpegFailedException):
+    pass
+
+
+def _to_float(value, suffix=""):
+    value = (value or "").strip()
+    if suffix and value.endswith(suffix):
+        value = value[: -len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_progress(block: dict) -> dict:
+    # One block of -progress output, key=value lines ending with progress=...
+    out_time_us = block.get("out_time_us") or block.get("out_time_ms")
+    total_size = block.get("total_size")
+    return {
+        **block,
+        "speed": _to_float(block.get("speed"), "x"),
+        "bitrate_kbps": _to_float(block.get("bitrate"), "kbits/s"),
+        "out_time_seconds": (
+            int(out_time_us) / 1000000
+            if out_time_us and out_time_us.lstrip("-").isdigit()
+            else None
+        ),
+        "total_size": int(total_size) if total_size and total_size.isdigit() else None,
+    }
+
+
+class FFmpegProcess:
+    # Runs ffmpeg with its stderr drained and its -progress output parsed on
+    # background threads, so neither pipe can fill up and block it. A watchdog
+    # kills it when neither progress nor output moves for stall_timeout seconds
+    # while the consumer waits in read. Time the consumer spends away from read
+    # is backpressure, ffmpeg is blocked on its stdout then and not stalled.
+    def __init__(
+        self,
+        args,
+        pass_fds=(),
+        on_progress: Optional[Callable[[dict], None]] = None,
+        stall_timeout: Optional[float] = 60,
+        stderr_tail_lines=50,
+    ) -> None:
+        self.args = list(args)
+        self.pass_fds = tuple(pass_fds)
+        self.on_progress = on_progress
+        self.stall_timeout = stall_timeout
+        self.metrics = {}
+        self._stderr_tail = deque(maxlen=stderr_tail_lines)
+        self._process: Optional[subprocess.Popen] = None
+        self._threads = []
+        self._stopped = threading.Event()
+        self._stalled = False
+        self._reading = False
+        self._last_activity = time.monotonic()
+        self._last_position = None
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process is not None else None
+
+    @property
+    def stdout_fd(self):
+        return self._process.stdout.fileno()
+
+    @property
+    def stderr_tail(self):
+        return list(self._stderr_tail)
+
+    def start(self) -> "FFmpegProcess":
+        progress_read_fd, progress_write_fd = os.pipe()
+        try:
+            self._process = subprocess.Popen(
+                [
+                    self.args[0],
+                    "-nostdin",
+                    "-nostats",
+                    "-progress",
+                    f"pipe:{progress_write_fd}",
+                    *self.args[1:],
+                ],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                shell=False,
+                close_fds=True,
+                pass_fds=(*self.pass_fds, progress_write_fd),
+            )
+        except Exception:
+            os.close(progress_read_fd)
+            raise
+        finally:
+            os.close(progress_write_fd)
+        logger.info(f"Started ffmpeg with pid {self._process.pid}")
+        self._mark_activity()
+        self._threads = [
+            threading.Thread(target=self._drain_stderr, daemon=True),
+            threading.Thread(
+                target=self._read_progress, args=(progress_read_fd,), daemon=True
+            ),
+        ]
+        if self.stall_timeout:
+            self._threads.append(threading.Thread(target=self._watch, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _mark_activity(self):
+        self._last_activity = time.monotonic()
+
+    def _drain_stderr(self):
+        for line in self._process.stderr:
+            line = line.decode(errors="replace").rstrip()
+            self._stderr_tail.append(line)
+            logger.debug(f"ffmpeg: {line}")
+
+    def _read_progress(self, progress_read_fd):
+        block = {}
+        with os.fdopen(progress_read_fd, "r", errors="replace") as f:
+            for line in f:
+                key, _, value = line.strip().partition("=")
+                block[key] = value
+                if key == "progress":
+                    self._update_metrics(parse_progress(block))
+                    block = {}
+
+    def _update_metrics(self, metrics):
+        position = (metrics["out_time_seconds"], metrics["total_size"])
+        if position != self._last_position:
+            self._last_position = position
+            self._mark_activity()
+        self.metrics = metrics
+        if self.on_progress is not None:
+            try:
+                self.on_progress(metrics)
+            except Exception:
+                logger.exception("ffmpeg progress callback failed")
+
+    def _watch(self):
+        interval = min(1.0, self.stall_timeout / 4)
+        while not self._stopped.wait(interval):
+            if self._process.poll() is not None:
+                return
+            if (
+                self._reading
+                and time.monotonic() - self._last_activity > self.stall_timeout
+            ):
+                logger.error(
+                    f"ffmpeg {self._process.pid} made no progress for {self.stall_timeout}s, killing it"
+                )
+                self._stalled = True
+                self._process.kill()
+                return
+
+    def read(self, size) -> bytes:
+        # The stall clock starts when the consumer comes back for data.
+        self._mark_activity()
+        self._reading = True
+        try:
+            chunk = os.read(self.stdout_fd, size)
+        finally:
+            self._reading = False
+        self._mark_activity()
+        return chunk
+
+    def iter_output(self, chunk_size=1024 * 1024):
+        # Yields stdout until ffmpeg exits and raises if it failed. The process
+        # is stopped when the consumer stops early.
+        try:
+            while True:
+                chunk = self.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+            self._process.wait()
+            self._check()
+        finally:
+            self.stop()
+
+    def _check(self):
+        if self._stalled:
+            raise FFmpegStalledException(
+                f"ffmpeg stalled for {self.stall_timeout}s: {self.stderr_tail[-5:]}"
+            )
+        if self._process.returncode != 0:
+            raise FFmpegFailedException(
+                f"ffmpeg exited with {self._process.returncode}: {self.stderr_tail[-5:]}"
+            )
+
+    def stop(self, timeout=5):
+        if self._process is None or self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                logger.warn(f"ffmpeg {self._process.pid} did not terminate, killing it")
+                self._process.kill()
+                self._process.wait()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._process.stdout.close()
+        self._process.stderr.close()
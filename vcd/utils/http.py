@@ -1,6 +1,16 @@
+from typing import Optional
 import requests
 import logging
+import re
 import traceback
+import http.client
+import http.cookiejar
+import socket
+import time
+import urllib3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
@@ -9,33 +19,136 @@ class RequestFailedException(Exception):
     pass
 
 
+# response_readinto relies on the private _fp of urllib3 responses, checked
+# against urllib3 2.
+_URLLIB3_FP_READINTO = urllib3.__version__.split(".")[0] == "2"
+
+
+def response_readinto(res: requests.Response):
+    # readinto of the http.client response below urllib3, which reads from the
+    # socket straight into the buffer. urllib3's own readinto copies through a
+    # bytes object and is used when the body has to be decoded, or when _fp is
+    # not the expected http.client response. Like urllib3, the fast path raises
+    # ProtocolError on a body shorter than its Content-Length and
+    # ReadTimeoutError when the read times out.
+    fp = getattr(res.raw, "_fp", None)
+    if (
+        not _URLLIB3_FP_READINTO
+        or not isinstance(fp, http.client.HTTPResponse)
+        or res.headers.get("Content-Encoding", "identity") != "identity"
+    ):
+        return res.raw.readinto
+
+    def readinto(buffer):
+        try:
+            read = fp.readinto(buffer)
+        except socket.timeout as e:
+            raise urllib3.exceptions.ReadTimeoutError(None, res.url, f"Read timed out: {e}")
+        except OSError as e:
+            raise urllib3.exceptions.ProtocolError(f"Connection broken: {e}", e)
+        if not read and len(buffer) and fp.length:
+            raise urllib3.exceptions.ProtocolError(
+                f"Response ended with {fp.length} bytes missing",
+                http.client.IncompleteRead(b"", fp.length),
+            )
+        return read
+
+    return readinto
+
+
 class UA:
     DEFAULT_UA = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
 
 
 class HttpClient:
-    def __init__(self, headers, proxies, retry: int = 3) -> None:
+    _CONTENT_RANGE_RE = re.compile(r"bytes\s+\d+-\d+/(?P<total>\d+)")
+
+    def __init__(
+        self,
+        headers,
+        proxies,
+        retry: int = 3,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        pool_block: bool = False,
+    ) -> None:
         self.headers = headers or {}
         self.proxies = proxies or {}
         self.retry = retry
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        self._session = self._build_session(self._adapter)
+
+    @staticmethod
+    def _build_session(adapter):
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        # Requests stay stateless as with the module level functions, cookies are
+        # passed explicitly per request and never picked up from responses.
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    def close(self):
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _pool_managers(self):
+        yield self._adapter.poolmanager
+        yield from self._adapter.proxy_manager.values()
+
+    def pool_stats(self):
+        stats = {}
+        for pool_manager in self._pool_managers():
+            for pool_key in pool_manager.pools.keys():
+                pool = pool_manager.pools.get(pool_key)
+                if pool is None:
+                    continue
+                # Unused slots of the urllib3 pool queue are filled with None.
+                idle = (
+                    sum(1 for conn in list(pool.pool.queue) if conn is not None)
+                    if pool.pool is not None
+                    else 0
+                )
+                stats[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                    "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+                    "idle": idle,
+                    "connections_opened": pool.num_connections,
+                    "requests": pool.num_requests,
+                }
+        return stats
 
     def _get_updated_headers(self, headers=None):
         headers = headers or {}
         headers.update(self.headers)
         return headers
 
-    def _retry(self, func, *args, **kwargs):
-        for i in range(self.retry):
+    def _retry(self, func, *args, retry: Optional[int] = None, **kwargs):
+        # retry overrides the attempts of the client for one call, 1 for requests
+        # whose body cannot be sent twice.
+        retry = self.retry if retry is None else retry
+        for i in range(retry):
             try:
                 return func(*args, **kwargs)
             except Exception as e:
                 logger.warn(
-                    f"Failed to execute {func.__name__}, retrying... {i + 1}/{self.retry}, traceback: {traceback.format_exc()}"
+                    f"Failed to execute {func.__name__}, retrying... {i + 1}/{retry}, traceback: {traceback.format_exc()}"
                 )
         raise RequestFailedException(f"Failed to execute {func.__name__}")
 
     def _get(self, url, accepted_status={200}, **kwargs):
-        res = requests.get(url, proxies=self.proxies, **kwargs)
+        res = self._session.get(url, proxies=self.proxies, **kwargs)
         if res.status_code not in accepted_status:
             logger.warn(f"Failed to get {url}, status code: {res.status_code}")
             raise RequestFailedException(
@@ -43,16 +156,20 @@ class HttpClient:
             )
         return res
 
-    def get(self, url, accepted_status={200}, **kwargs) -> requests.Response:
+    def get(
+        self, url, accepted_status={200}, retry: Optional[int] = None, **kwargs
+    ) -> requests.Response:
         headers = self._get_updated_headers(kwargs.get("headers", {}))
         kwargs["headers"] = headers
 
-        res = self._retry(self._get, url=url, accepted_status=accepted_status, **kwargs)
+        res = self._retry(
+            self._get, url=url, accepted_status=accepted_status, retry=retry, **kwargs
+        )
 
         return res
 
     def _post(self, url, accepted_status={200}, **kwargs):
-        res = requests.post(url, proxies=self.proxies, **kwargs)
+        res = self._session.post(url, proxies=self.proxies, **kwargs)
         if res.status_code not in accepted_status:
             logger.warn(f"Failed to post {url}, status code: {res.status_code}")
             raise RequestFailedException(
@@ -60,12 +177,126 @@ class HttpClient:
             )
         return res
 
-    def post(self, url, accepted_status={200}, **kwargs) -> requests.Response:
+    def post(
+        self, url, accepted_status={200}, retry: Optional[int] = None, **kwargs
+    ) -> requests.Response:
         headers = self._get_updated_headers(kwargs.get("headers", {}))
         kwargs["headers"] = headers
 
         res = self._retry(
-            self._post, url=url, accepted_status=accepted_status, **kwargs
+            self._post, url=url, accepted_status=accepted_status, retry=retry, **kwargs
         )
 
         return res
+
+    def probe(self, url, method="range", timeout=10, **kwargs):
+        # One cheap request without retries: a HEAD, or a GET of the first byte.
+        headers = self._get_updated_headers(kwargs.pop("headers", {}))
+        start = time.perf_counter()
+        try:
+            if method == "head":
+                res = self._session.head(
+                    url,
+                    headers=headers,
+                    proxies=self.proxies,
+                    timeout=timeout,
+                    allow_redirects=True,
+                    **kwargs,
+                )
+            else:
+                headers["Range"] = "bytes=0-0"
+                res = self._session.get(
+                    url,
+                    headers=headers,
+                    proxies=self.proxies,
+                    timeout=timeout,
+                    stream=True,
+                    **kwargs,
+                )
+            res.close()
+        except requests.RequestException as e:
+            logger.warn(f"Failed to probe {url}: {e}")
+            return {
+                "reachable": False,
+                "status": None,
+                "latency": time.perf_counter() - start,
+            }
+        return {
+            "reachable": res.status_code in {200, 206},
+            "status": res.status_code,
+            "latency": time.perf_counter() - start,
+        }
+
+    def content_length(self, url, **kwargs) -> Optional[int]:
+        # Total size from a one byte range request, None if the server does not
+        # support ranges.
+        headers = self._get_updated_headers(dict(kwargs.pop("headers", None) or {}))
+        headers["Range"] = "bytes=0-0"
+        with self.get(
+            url, accepted_status={200, 206}, headers=headers, stream=True, **kwargs
+        ) as res:
+            if res.status_code != 206:
+                return None
+            match = self._CONTENT_RANGE_RE.match(res.headers.get("Content-Range", ""))
+        return int(match.group("total")) if match else None
+
+    def _get_range(self, url, start, end, **kwargs):
+        res = self._get(url, accepted_status={206}, **kwargs)
+        content = res.content
+        if len(content) != end - start + 1:
+            raise RequestFailedException(
+                f"Short read of range {start}-{end} of {url}: {len(content)} bytes"
+            )
+        return content
+
+    def get_range(self, url, start, end, **kwargs) -> bytes:
+        headers = self._get_updated_headers(dict(kwargs.pop("headers", None) or {}))
+        headers["Range"] = f"bytes={start}-{end}"
+        return self._retry(
+            self._get_range, url=url, start=start, end=end, headers=headers, **kwargs
+        )
+
+    def iter_ranges(
+        self,
+        url,
+        content_length: Optional[int] = None,
+        connections: int = 4,
+        range_size: int = 2 * 1024 * 1024,
+        max_buffered_ranges: Optional[int] = None,
+        start: int = 0,
+        **kwargs,
+    ):
+        # Downloads url over concurrent range requests and yields the ranges in
+        # order. At most max_buffered_ranges ranges are in flight or waiting to
+        # be consumed, which bounds memory to about that many times range_size.
+        # start skips the bytes before it, to resume an interrupted download.
+        if content_length is None:
+            content_length = self.content_length(url, **kwargs)
+        if content_length is None:
+            if start:
+                raise RequestFailedException(f"Cannot resume {url}, ranges not supported")
+            logger.warn(f"Ranges not supported for {url}, downloading sequentially")
+            with self.get(url, stream=True, **kwargs) as res:
+                yield from res.iter_content(chunk_size=range_size)
+            return
+
+        max_buffered_ranges = max_buffered_ranges or 2 * connections
+        ranges = (
+            (range_start, min(range_start + range_size, content_length) - 1)
+            for range_start in range(start, content_length, range_size)
+        )
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=connections)
+        try:
+            for range_start, range_end in ranges:
+                pending.append(
+                    executor.submit(
+                        self.get_range, url, range_start, range_end, **kwargs
+                    )
+                )
+                if len(pending) >= max_buffered_ranges:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
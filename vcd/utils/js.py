@@ -0,0 +1,220 @@
+from typing import List, Optional
+from hashlib import sha1
+from vcd.utils.pipe import write_all
+import execjs
+import json
+import logging
+import os
+import selectors
+import shutil
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class JsCallFailedException(Exception):
+    pass
+
+
+class JsRuntime:
+    name = "base"
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self) -> None:
+        self._stats = {"calls": 0, "items": 0, "seconds": 0.0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def default(cls) -> "JsRuntime":
+        # A warm node process when node is installed, execjs otherwise.
+        with JsRuntime._default_lock:
+            if JsRuntime._default is None:
+                node_path = shutil.which("node")
+                JsRuntime._default = (
+                    NodeJsRuntime(node_path) if node_path else ExecJsRuntime()
+                )
+            return JsRuntime._default
+
+    @classmethod
+    def set_default(cls, runtime: "JsRuntime"):
+        with JsRuntime._default_lock:
+            JsRuntime._default = runtime
+
+    def _record(self, items, seconds):
+        with self._stats_lock:
+            self._stats["calls"] += 1
+            self._stats["items"] += items
+            self._stats["seconds"] += seconds
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["backend"] = self.name
+        stats["avg_call_seconds"] = (
+            stats["seconds"] / stats["calls"] if stats["calls"] else 0.0
+        )
+        return stats
+
+    def _call_many(self, source: str, func_name: str, args: list) -> list:
+        raise NotImplementedError()
+
+    def call_many(self, source: str, func_name: str, args: list) -> list:
+        # Calls func_name once per argument in a single round trip to the runtime.
+        if not args:
+            return []
+        start = time.perf_counter()
+        try:
+            return self._call_many(source, func_name, list(args))
+        finally:
+            self._record(len(args), time.perf_counter() - start)
+
+    def call(self, source: str, func_name: str, arg):
+        return self.call_many(source, func_name, [arg])[0]
+
+    def close(self):
+        pass
+
+
+class ExecJsRuntime(JsRuntime):
+    name = "execjs"
+
+    _CALL_MANY_JS = """
+    function __vcd_call_many(args) {{
+        return args.map(function (arg) {{ return {func_name}(arg); }});
+    }}
+    """
+
+    def __init__(self, runtime=None) -> None:
+        super().__init__()
+        self._runtime = runtime or execjs.get()
+        self.name = f"execjs:{self._runtime.name}"
+        self._contexts = {}
+        self._lock = threading.Lock()
+
+    def _get_context(self, source, func_name):
+        key = (func_name, source)
+        with self._lock:
+            if key not in self._contexts:
+                self._contexts[key] = self._runtime.compile(
+                    source + self._CALL_MANY_JS.format(func_name=func_name)
+                )
+            return self._contexts[key]
+
+    def _call_many(self, source, func_name, args):
+        try:
+            return self._get_context(source, func_name).call("__vcd_call_many", args)
+        except execjs.Error as e:
+            raise JsCallFailedException(f"Failed to call {func_name}: {e}")
+
+
+class NodeJsRuntime(JsRuntime):
+    name = "node"
+
+    # Line based JSON protocol, sources are evaluated once per key in their own
+    # context and kept for the lifetime of the process.
+    _SERVER_JS = r"""
+    const vm = require("vm");
+    const readline = require("readline");
+    const contexts = {};
+    readline.createInterface({ input: process.stdin }).on("line", (line) => {
+        let res;
+        try {
+            const req = JSON.parse(line);
+            if (req.source !== undefined) {
+                contexts[req.key] = vm.createContext({});
+                vm.runInContext(req.source, contexts[req.key]);
+            }
+            const func = vm.runInContext(req.func, contexts[req.key]);
+            res = { result: req.args.map((arg) => func(arg)) };
+        } catch (e) {
+            res = { error: String(e) };
+        }
+        process.stdout.write(JSON.stringify(res) + "\n");
+    });
+    """
+
+    def __init__(self, node_path="node", timeout: Optional[float] = 30) -> None:
+        super().__init__()
+        self.node_path = node_path
+        # Seconds to wait for an answer. The process is shared, so a call that
+        # hangs is killed instead of blocking every later call.
+        self.timeout = timeout
+        self._process: Optional[subprocess.Popen] = None
+        self._loaded_keys = set()
+        self._lock = threading.Lock()
+
+    def _ensure_process(self):
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                [self.node_path, "-e", self._SERVER_JS],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                bufsize=0,
+            )
+            self._loaded_keys = set()
+            logger.info(f"Started node runtime with pid {self._process.pid}")
+        return self._process
+
+    def _read_line(self, process) -> bytes:
+        # One line of stdout, b"" if node exited, None after the timeout.
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        line = bytearray()
+        with selectors.DefaultSelector() as selector:
+            selector.register(process.stdout, selectors.EVENT_READ)
+            while not line.endswith(b"\n"):
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not selector.select(remaining):
+                        return None
+                chunk = os.read(process.stdout.fileno(), 65536)
+                if not chunk:
+                    return b""
+                line += chunk
+        return bytes(line)
+
+    def _request(self, req):
+        process = self._ensure_process()
+        try:
+            write_all(process.stdin.fileno(), (json.dumps(req) + "\n").encode())
+            line = self._read_line(process)
+        except (BrokenPipeError, OSError) as e:
+            self._kill()
+            raise JsCallFailedException(f"Node runtime failed: {e}")
+        if line is None:
+            self._kill()
+            raise JsCallFailedException(
+                f"Node runtime did not answer {req['func']} within {self.timeout}s, restarting it."
+            )
+        if not line:
+            self._kill()
+            raise JsCallFailedException("Node runtime exited unexpectedly.")
+        res = json.loads(line)
+        if "error" in res:
+            raise JsCallFailedException(f"Failed to call {req['func']}: {res['error']}")
+        return res["result"]
+
+    def _call_many(self, source, func_name, args) -> List:
+        key = sha1(source.encode()).hexdigest()
+        with self._lock:
+            self._ensure_process()
+            req = {"key": key, "func": func_name, "args": args}
+            if key not in self._loaded_keys:
+                req["source"] = source
+            res = self._request(req)
+            self._loaded_keys.add(key)
+            return res
+
+    def _kill(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+    def close(self):
+        with self._lock:
+            self._kill()
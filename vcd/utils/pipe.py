@@ -0,0 +1,69 @@
+import fcntl
+import logging
+import os
+import stat
+import sys
+
+logger = logging.getLogger(__name__)
+
+# fcntl only has the constant on linux with python 3.10+.
+_F_SETPIPE_SZ = getattr(
+    fcntl, "F_SETPIPE_SZ", 1031 if sys.platform.startswith("linux") else None
+)
+
+DEFAULT_PIPE_SIZE = 1024 * 1024
+
+
+def set_pipe_size(fd, size=DEFAULT_PIPE_SIZE):
+    # Returns the new size, or None if it could not be changed. Unprivileged
+    # processes are capped by /proc/sys/fs/pipe-max-size.
+    if _F_SETPIPE_SZ is None:
+        return None
+    try:
+        return fcntl.fcntl(fd, _F_SETPIPE_SZ, size)
+    except OSError as e:
+        logger.debug(f"Failed to set pipe size of fd {fd} to {size}: {e}")
+        return None
+
+
+def is_pipe(fd):
+    try:
+        return stat.S_ISFIFO(os.fstat(fd).st_mode)
+    except OSError:
+        return False
+
+
+def write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
+def splice_all(src_fd, dst_fd, count=DEFAULT_PIPE_SIZE):
+    # Moves everything from src_fd to dst_fd inside the kernel, one of them has
+    # to be a pipe.
+    total = 0
+    while True:
+        moved = os.splice(src_fd, dst_fd, count)
+        if moved == 0:
+            return total
+        total += moved
+
+
+def can_splice(src_fd, dst_fd):
+    return hasattr(os, "splice") and (is_pipe(src_fd) or is_pipe(dst_fd))
+
+
+def copy_fd(src_fd, dst_fd, buffer_size=DEFAULT_PIPE_SIZE):
+    # splice when possible, otherwise a read and write loop through one buffer.
+    if can_splice(src_fd, dst_fd):
+        return splice_all(src_fd, dst_fd, buffer_size)
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    total = 0
+    while True:
+        read = os.readv(src_fd, [buffer])
+        if read == 0:
+            return total
+        write_all(dst_fd, view[:read])
+        total += read
@@ -1,14 +1,75 @@
+import asyncio
+import threading
+import time
+
+
 class Stateful:
+    # A value published by one thread and waited for by others, without
+    # polling. Waiters are woken by set or set_exception.
     def __init__(self) -> None:
         self._val = None
+        self._exception = None
+        self._is_set = False
+        self._condition = threading.Condition()
+        self._callbacks = []
+
+    def is_set(self):
+        return self._is_set
 
-    def get(self, block=False, is_timeout=None):
+    def get(self, block=False, timeout=None, is_timeout=None):
+        # timeout is in seconds. is_timeout is a callable for deadlines shared
+        # with other steps, it is checked every second while waiting.
         if block:
-            while self._val is None:
-                if is_timeout is not None and is_timeout():
-                    raise TimeoutError()
-                pass
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            with self._condition:
+                while not self._is_set:
+                    if is_timeout is not None and is_timeout():
+                        raise TimeoutError()
+                    wait = None if is_timeout is None else 1
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError()
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._condition.wait(wait)
+        if self._exception is not None:
+            raise self._exception
         return self._val
 
+    async def get_async(self, timeout=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            if not future.done():
+                future.set_result(None)
+
+        self._add_callback(lambda: loop.call_soon_threadsafe(wake))
+        await asyncio.wait_for(future, timeout)
+        return self.get()
+
+    def __await__(self):
+        return self.get_async().__await__()
+
+    def _add_callback(self, callback):
+        with self._condition:
+            if not self._is_set:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def _publish(self, value, exception):
+        with self._condition:
+            self._val = value
+            self._exception = exception
+            self._is_set = True
+            self._condition.notify_all()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
     def set(self, new_value):
-        self._val = new_value
+        self._publish(new_value, None)
+
+    def set_exception(self, exception):
+        self._publish(None, exception)
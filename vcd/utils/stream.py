@@ -1,4 +1,8 @@
+from collections import deque
 import queue
+import threading
+
+
 class WriteableQueue(queue.Queue):
 
     def write(self, data):
@@ -10,3 +14,155 @@ class WriteableQueue(queue.Queue):
 
     def close(self):
         self.put(None)
+
+
+class ByteQueue:
+    # Pipe between a writer and a reader thread bounded by bytes instead of
+    # items. write blocks while max_bytes are buffered, small writes are
+    # appended to the last chunk instead of queued one by one, and the reader
+    # side is file like, so it can be passed as a requests body.
+    def __init__(self, max_bytes=8 * 1024 * 1024, coalesce_size=64 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.coalesce_size = coalesce_size
+        self._chunks = deque()
+        # Bytes of the first chunk that were already read.
+        self._offset = 0
+        # Only chunks created by coalescing are mutable and may be extended.
+        self._tail_mutable = False
+        self._buffered = 0
+        self._closed = False
+        self._aborted = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._stats = {
+            "high_water_mark": 0,
+            "writes": 0,
+            "coalesced_writes": 0,
+            "reads": 0,
+            "writer_waits": 0,
+        }
+
+    def write(self, data):
+        size = len(data)
+        if not size:
+            return 0
+        with self._lock:
+            # A stopped reader is reported the same way to every writer.
+            if self._aborted:
+                raise BrokenPipeError("The reader of the ByteQueue stopped.")
+            if self._closed:
+                raise ValueError("Write to a closed ByteQueue.")
+            # A write larger than the budget goes through once the queue is empty.
+            while (
+                not self._aborted
+                and self._buffered
+                and self._buffered + size > self.max_bytes
+            ):
+                self._stats["writer_waits"] += 1
+                self._not_full.wait()
+            if self._aborted:
+                raise BrokenPipeError("The reader of the ByteQueue stopped.")
+            if (
+                self._tail_mutable
+                and self._chunks
+                and len(self._chunks[-1]) + size <= self.coalesce_size
+            ):
+                self._chunks[-1] += data
+                self._stats["coalesced_writes"] += 1
+            elif size < self.coalesce_size:
+                self._chunks.append(bytearray(data))
+                self._tail_mutable = True
+            else:
+                # Large writes are kept as they are, only copied if mutable.
+                self._chunks.append(data if isinstance(data, bytes) else bytes(data))
+                self._tail_mutable = False
+            self._buffered += size
+            self._stats["writes"] += 1
+            self._stats["high_water_mark"] = max(
+                self._stats["high_water_mark"], self._buffered
+            )
+            self._not_empty.notify()
+        return size
+
+    def close(self):
+        # End of data, the reader gets the rest and then b"".
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+
+    def abort(self):
+        # Called by the reader when it stops, blocked and later writes fail.
+        with self._lock:
+            self._aborted = True
+            self._closed = True
+            self._chunks.clear()
+            self._buffered = 0
+            self._not_full.notify_all()
+            self._not_empty.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def _wait_for_data(self):
+        while not self._buffered and not self._closed:
+            self._not_empty.wait()
+
+    def _consume(self, size):
+        self._offset += size
+        self._buffered -= size
+        if self._offset == len(self._chunks[0]):
+            self._chunks.popleft()
+            self._offset = 0
+            if not self._chunks:
+                self._tail_mutable = False
+        self._stats["reads"] += 1
+        self._not_full.notify_all()
+
+    def read(self, size=-1) -> bytes:
+        # Up to size bytes of the first buffered chunk, blocking until there
+        # is data. b"" at the end of the data.
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(self.max_bytes), b""))
+        with self._lock:
+            self._wait_for_data()
+            if not self._buffered or size == 0:
+                return b""
+            chunk = self._chunks[0]
+            if self._offset == 0 and len(chunk) <= size and isinstance(chunk, bytes):
+                data = chunk
+            else:
+                with memoryview(chunk) as view:
+                    data = bytes(view[self._offset : self._offset + size])
+            self._consume(len(data))
+            return data
+
+    def readinto(self, buffer) -> int:
+        with memoryview(buffer) as view, view.cast("B") as target:
+            with self._lock:
+                self._wait_for_data()
+                copied = 0
+                while self._buffered and copied < len(target):
+                    with memoryview(self._chunks[0]) as source:
+                        size = min(len(target) - copied, len(source) - self._offset)
+                        target[copied : copied + size] = source[
+                            self._offset : self._offset + size
+                        ]
+                    self._consume(size)
+                    copied += size
+                return copied
+
+    def readable(self):
+        return True
+
+    def __iter__(self):
+        return iter(lambda: self.read(self.coalesce_size), b"")
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "buffered_bytes": self._buffered,
+                "max_bytes": self.max_bytes,
+            }